@@ -1,104 +1,127 @@
+import multiprocessing
+import os
 import random
+import time
 from typing import Counter
-
-knightScores = [
-    [1, 1, 1, 1, 1, 1, 1, 1],
-    [1, 2, 2, 2, 2, 2, 2, 1],
-    [1, 2, 3, 3, 3, 3, 2, 1],
-    [1, 2, 3, 4, 4, 3, 2, 1],
-    [1, 2, 3, 4, 4, 3, 2, 1],
-    [1, 2, 3, 3, 3, 3, 2, 1],
-    [1, 2, 2, 2, 2, 2, 2, 1],
-    [1, 1, 1, 1, 1, 1, 1, 1],
-]
-
-bishopScores = [
-    [4, 3, 2, 1, 1, 2, 3, 4],
-    [3, 4, 3, 2, 2, 3, 4, 3],
-    [2, 3, 4, 2, 3, 4, 3, 2],
-    [1, 2, 3, 4, 4, 3, 2, 1],
-    [1, 2, 3, 4, 4, 3, 2, 1],
-    [2, 3, 4, 3, 3, 4, 3, 2],
-    [3, 4, 3, 2, 2, 3, 4, 3],
-    [4, 3, 2, 1, 1, 2, 3, 4],
-]
-
-queenScores = [
-    [1, 1, 1, 1, 1, 1, 1, 1],
-    [1, 2, 2, 2, 2, 2, 2, 1],
-    [1, 2, 3, 3, 3, 3, 2, 1],
-    [1, 2, 3, 2, 2, 3, 2, 1],
-    [1, 2, 3, 2, 2, 3, 2, 1],
-    [1, 2, 3, 3, 3, 3, 2, 1],
-    [1, 2, 2, 2, 2, 2, 2, 1],
-    [1, 1, 1, 1, 1, 1, 1, 1],
-]
-
-rookScores = [
-    [4, 3, 3, 4, 4, 3, 3, 4],
-    [2, 2, 2, 3, 3, 2, 2, 2],
-    [1, 1, 1, 1, 1, 1, 1, 1],
-    [1, 1, 1, 1, 1, 1, 1, 1],
-    [1, 1, 1, 1, 1, 1, 1, 1],
-    [1, 1, 1, 1, 1, 1, 1, 1],
-    [2, 2, 2, 3, 3, 2, 2, 2],
-    [4, 3, 3, 4, 4, 3, 3, 4],
-]
-
-whiteKingScores = [
-    [0, 0, 0, 0, 0, 0, 0, 0],
-    [0, 0, 0, 0, 0, 0, 0, 0],
-    [0, 0, 0, 0, 0, 0, 0, 0],
-    [0, 0, 0, 0, 0, 0, 0, 0],
-    [0, 0, 0, 0, 0, 0, 0, 0],
-    [0, 0, 0, 0, 0, 0, 0, 0],
-    [0, 0, 0, 0, 0, 0, 0, 0],
-    [0, 0, 2, 0, 0, 0, 2, 0],
-]
-
-blackKingScores = [
-    [0, 0, 2, 0, 0, 0, 2, 0],
-    [0, 0, 0, 0, 0, 0, 0, 0],
-    [0, 0, 0, 0, 0, 0, 0, 0],
-    [0, 0, 0, 0, 0, 0, 0, 0],
-    [0, 0, 0, 0, 0, 0, 0, 0],
-    [0, 0, 0, 0, 0, 0, 0, 0],
-    [0, 0, 0, 0, 0, 0, 0, 0],
-    [0, 0, 0, 0, 0, 0, 0, 0],
-]
-
-whitePawnScores = [
-    [9, 9, 9, 9, 9, 9, 9, 9],
-    [5, 5, 5, 5, 5, 5, 5, 5],
-    [4, 4, 4, 4, 4, 4, 4, 4],
-    [3, 3, 3, 3, 3, 3, 3, 3],
-    [1, 1, 2, 1, 2, 1, 2, 1],
-    [1, 1, 1, 1, 1, 1, 1, 1],
-    [1, 1, 1, 1, 1, 1, 1, 1],
-    [0, 0, 0, 0, 0, 0, 0, 0],
-]
-
-blackPawnScores = [
-    [0, 0, 0, 0, 0, 0, 0, 0],
-    [1, 1, 1, 1, 1, 1, 1, 1],
-    [1, 1, 1, 1, 1, 1, 1, 1],
-    [1, 1, 2, 1, 2, 1, 2, 1],
-    [3, 3, 3, 3, 3, 3, 3, 3],
-    [4, 4, 4, 4, 4, 4, 4, 4],
-    [6, 6, 6, 6, 6, 6, 6, 6],
-    [9, 9, 9, 9, 9, 9, 9, 9],
-]
-
-piecePositionScores = {'N' : knightScores, 'Q': queenScores, 'B' : bishopScores,
-                        'R': rookScores, 'bp': blackPawnScores, 'wp': whitePawnScores,
-                         'wK' : whiteKingScores, 'bK' : blackKingScores}
-
-pieceScores = {'K': 0, 'Q': 9, 'R': 5, 'B': 3, 'N': 3, 'p': 1}
-
-CHECKMATE = 1000
+from ChessEngine import Move
+from ChessEvaluation import pieceScores, taperedPhases, MAX_PHASE
+
+PAWN_VALUE = 100 # The search scores in centipawns, integers so the null window can be exactly one
+CHECKMATE = 1000 * PAWN_VALUE
+# The search scores being mated as -CHECKMATE plus the plies to the mate, so it prefers the fastest mate and the
+# longest defence. Scores past MATE_THRESHOLD either way are mates.
+MATE_THRESHOLD = CHECKMATE - 1000
 STALEMATE = 0
 DEPTH = 3
 
+# Transposition table entry flags: the stored score is exact, a lower bound (fail high) or an upper bound (fail low)
+EXACT = 0
+LOWERBOUND = 1
+UPPERBOUND = 2
+TT_SIZE = 1 << 20 # Number of entries in the transposition table, must be a power of two
+USE_TRANSPOSITION_TABLE = True
+
+"""
+A fixed size hash table of searched positions indexed by the low bits of the GameState Zobrist key.
+Each slot holds one entry (key, depth, score, flag, moveID, age), the best move being kept as its Move.moveID. A new entry replaces the old one if the
+slot is empty, holds the same position, was written during an older search or was searched less deep.
+"""
+class TranspositionTable():
+    def __init__(self, size = TT_SIZE):
+        self.size = size
+        self.mask = size - 1
+        self.entries = [None] * size
+        self.age = 0
+        self.hits = 0
+        self.stores = 0
+
+    def clear(self):
+        self.entries = [None] * self.size
+        self.age = 0
+
+    """
+    Called before every search so entries from older searches get replaced first
+    """
+    def newSearch(self):
+        self.age += 1
+        self.hits = 0
+        self.stores = 0
+
+    def probe(self, key):
+        entry = self.entries[key & self.mask]
+        if entry is not None and entry[0] == key:
+            self.hits += 1
+            return entry
+        return None
+
+    def store(self, key, depth, score, flag, moveID):
+        index = key & self.mask
+        entry = self.entries[index]
+        if entry is None or entry[0] == key or entry[5] != self.age or depth >= entry[1]:
+            self.entries[index] = (key, depth, score, flag, moveID, self.age)
+            self.stores += 1
+
+"""
+A mate score counts the plies from the root, the table keeps it as the plies from the position itself so it still
+holds when the position is reached at another ply. scoreFromTable turns it back.
+"""
+def scoreToTable(score, ply):
+    if score >= MATE_THRESHOLD:
+        return score + ply
+    if score <= -MATE_THRESHOLD:
+        return score - ply
+    return score
+
+def scoreFromTable(score, ply):
+    if score >= MATE_THRESHOLD:
+        return score - ply
+    if score <= -MATE_THRESHOLD:
+        return score + ply
+    return score
+
+MAX_DEPTH = 64 # Deepest iteration of iterativeDeepeningAlgorithm when only a time limit is given
+MAX_PLY = 2 * MAX_DEPTH # Check extensions can take a line past the iteration depth, up to twice as far
+TIME_CHECK_NODES = 63 # The clock is checked once every TIME_CHECK_NODES + 1 nodes
+
+# Principal variation search: the moves after the first are searched with a null window around alpha and only
+# searched again with the full window when they beat it
+USE_PRINCIPAL_VARIATION_SEARCH = True
+NULL_WINDOW = 1 # The smallest difference between two scores
+# Aspiration windows: each iteration after the first starts with a window a pawn either side of the
+# score of the last one, widened when the score falls outside it
+ASPIRATION_WINDOW = PAWN_VALUE
+
+# Selective search, the moves that look unpromising are searched less deeply and checks more deeply
+USE_NULL_MOVE = True # Pass the turn, if a reduced search still fails high the node is cut off without a move
+NULL_MOVE_REDUCTION = 2 # Plies taken off the null move search besides the move itself
+NULL_MOVE_MIN_DEPTH = 3
+USE_LATE_MOVE_REDUCTIONS = True # Quiet moves ordered late are searched a ply less unless they beat alpha
+LMR_MIN_DEPTH = 3
+LMR_MOVES = 3 # Moves searched at full depth before the reductions start
+USE_CHECK_EXTENSIONS = True # A move that gives check is searched a ply deeper
+
+# Move ordering: hash move first, then captures by MVV-LVA, then killer moves, then quiet moves by history
+USE_MOVE_ORDERING = True
+HASH_MOVE_SCORE = 1000000
+CAPTURE_SCORE = 100000
+KILLER_SCORE = 90000
+MAX_KILLERS = 2 # Killer moves remembered per ply
+
+# Quiescence search: below depth 0 captures and promotions are played out until the position is quiet
+USE_QUIESCENCE = True
+QUIESCENCE_CHECK_PLIES = 0 # Quiet moves that give check are searched too in this many plies below depth 0
+DELTA_MARGIN = 2 * PAWN_VALUE # Captures that can't raise the score to within this margin of alpha are skipped
+
+# Static exchange evaluation: captures that lose material once the exchange on their square is played out are
+# searched after the quiet moves and left out of the quiescence search
+USE_STATIC_EXCHANGE = True
+
+"""
+Raised inside the search when the time runs out, the search unwinds to iterativeDeepeningAlgorithm
+"""
+class SearchTimeout(Exception):
+    pass
+
 """
 Algorithm that picks random moves.
 """
@@ -222,7 +245,6 @@ def negaMaxAlgorithm(gs, validMoves):
     random.shuffle(validMoves)
     counter = 0
     findMoveNegaMax(gs, validMoves, DEPTH, 1 if gs.whiteToMove else -1)
-    print(counter)
     return nextMove
 
 """
@@ -247,43 +269,560 @@ def findMoveNegaMax(gs, validMoves, depth, turnMultiplier):
     return maxScore
 
 """
-Calls the recursve method findMoveNegaMax the first time 
+If a capture loses material. Taking a piece worth at least as much as the capturing one never does, the other
+captures are played out with the static exchange evaluation, or count as losing when USE_STATIC_EXCHANGE is off.
 """
-def alphaBetaNegaMaxAlgorithm(gs, validMoves, depth):
-    global nextMove, counter, DEPTH
-    DEPTH = depth
-    nextMove = None
-    random.shuffle(validMoves)
-    counter = 0
-    findMoveNegaMaxAlphaBeta(gs, validMoves, depth, -CHECKMATE, CHECKMATE, 1 if gs.whiteToMove else -1)
-    print(counter)
-    return nextMove
+def isLosingCapture(gs, move):
+    if not move.isCapture or pieceScores[move.pieceCaptured[1]] >= pieceScores[move.pieceMoved[1]]:
+        return False
+    return not USE_STATIC_EXCHANGE or gs.staticExchange(move) < 0
 
 """
-Same as findMoveNegaMax but with alpha beta pruning implemented
+Most valuable victim first, the least valuable attacker breaks ties. Promotions count as taking a queen.
 """
-def findMoveNegaMaxAlphaBeta(gs, validMoves, depth, alpha, beta, turnMultiplier):
-    global nextMove, counter
-    counter += 1
-    if depth == 0:
-        return turnMultiplier * scoreBoard(gs)
+def mvvLvaScore(move):
+    if move.isCapture:
+        return 10 * pieceScores[move.pieceCaptured[1]] - pieceScores[move.pieceMoved[1]]
+    if move.isPawnPromotion:
+        return 10 * pieceScores['Q']
+    return -pieceScores[move.pieceMoved[1]]
 
-    # Move ordering - Implement later
-    maxScore = -CHECKMATE
-    for move in validMoves:
+"""
+Milliseconds to spend on one move when playing on a clock: an even share of the remaining time
+over movesToGo moves plus most of the increment, never more than the clock minus a safety margin
+"""
+def allocateTime(clock, increment = 0, movesToGo = None):
+    if movesToGo is None:
+        movesToGo = 30
+    moveTime = clock / movesToGo + increment * 0.8
+    return max(min(moveTime, clock - 50), 1)
+
+"""
+The alpha beta search and everything it learns: the transposition table, the killer moves, the history table,
+the principal variation and the statistics of the last search. Make one per game and keep it between the moves,
+every search ages what the last one left (see newSearch) instead of starting cold. Two searchers don't share
+anything, so they can play each other in one process.
+"""
+class Searcher():
+    def __init__(self, ttSize = TT_SIZE):
+        self.transpositionTable = TranspositionTable(ttSize)
+        self.killerMoves = [[] for ply in range(MAX_PLY + 1)] # Move ids of the quiet moves that caused a beta cutoff, per ply
+        self.historyTable = {} # (piece moved, end row, end col) -> sum of depth squared over the quiet moves that caused a cutoff
+        self.pvTable = [[] for ply in range(MAX_PLY + 1)] # Triangular PV table, the best line found so far from each ply
+        self.principalVariation = [] # (Zobrist key, move) pairs of the best line found by the last completed iteration
+        self.nextMove = None # Best root move of the running iteration
+        self.depth = DEPTH # Depth of the running iteration
+        self.searchScore = 0 # Score of the move returned by the last search, for the side that was to move
+        self.counter = 0 # Nodes searched by the last search
+        self.betaCutoffs = 0 # Nodes that failed high
+        self.firstMoveCutoffs = 0 # Nodes that failed high on the first move searched
+        self.searchDeadline = None # time.perf_counter() value at which the running search has to stop, None for no limit
+        self.stopSearch = False # Set from another thread to make the running search return its best move so far
+        # Root-split parallel search: the worker processes are started once and kept for the next searches
+        self.searchPool = None
+        self.searchPoolSize = 0
+
+    """
+    Forget everything learned, for a new game
+    """
+    def clear(self):
+        self.transpositionTable.clear()
+        self.historyTable.clear()
+        for killers in self.killerMoves:
+            killers.clear()
+        self.principalVariation = []
+
+    """
+    Get ready for a search of gs. The transposition table entries of older searches are replaced first and
+    the history scores are halved, so what this search learns counts the most. The killers belong to the plies
+    of the last search and are forgotten. If the principal variation of the last search went through gs its
+    rest is searched first again.
+    """
+    def newSearch(self, gs):
+        self.transpositionTable.newSearch()
+        for killers in self.killerMoves:
+            killers.clear()
+        historyTable = self.historyTable
+        for key in list(historyTable):
+            historyTable[key] //= 2
+            if historyTable[key] == 0:
+                del historyTable[key]
+        line = self.principalVariation
+        self.principalVariation = next((line[i:] for i in range(len(line)) if line[i][0] == gs.zobristKey), [])
+        self.nextMove = None
+        self.counter = 0
+        self.betaCutoffs = 0
+        self.firstMoveCutoffs = 0
+
+    """
+    Calls the recursve method findMoveNegaMax the first time
+    """
+    def alphaBetaNegaMaxAlgorithm(self, gs, validMoves, depth):
+        self.depth = depth
+        random.shuffle(validMoves)
+        self.newSearch(gs)
+        self.searchScore = self.findMoveNegaMaxAlphaBeta(gs, validMoves, depth, -CHECKMATE, CHECKMATE, 1 if gs.whiteToMove else -1)
+        if self.nextMove is None and validMoves:
+            self.nextMove = validMoves[0] # Every move loses to a mate, play one anyway
+        self.principalVariation = self.getPrincipalVariation(gs)
+        return self.nextMove
+
+    """
+    If the running search has to stop now, because stopSearch was set or the deadline has passed
+    """
+    def searchStopped(self):
+        return self.stopSearch or (self.searchDeadline is not None and time.perf_counter() > self.searchDeadline)
+
+    """
+    Searches depth 1, 2, 3 ... until maxDepth is reached or the time budget runs out and returns the best move
+    of the last completed iteration. The budget is either moveTime milliseconds for this move or a share of the
+    remaining clock (with increment) in milliseconds. The principal variation of each iteration is searched first
+    in the next one. After every iteration infoCallback, if given, gets the depth, the score for the side to move,
+    the nodes and seconds so far and the principal variation as a list of moves.
+    """
+    def iterativeDeepeningAlgorithm(self, gs, validMoves, maxDepth = MAX_DEPTH, moveTime = None, clock = None, increment = 0,
+                                    movesToGo = None, infoCallback = None):
+        if moveTime is None and clock is not None:
+            moveTime = allocateTime(clock, increment, movesToGo)
+        startTime = time.perf_counter()
+        self.searchDeadline = None if moveTime is None else startTime + moveTime / 1000
+        random.shuffle(validMoves)
+        self.newSearch(gs)
+        bestMove = None
+        moveLogLength = len(gs.moveLog)
+        for depth in range(1, maxDepth + 1):
+            self.depth = depth
+            try:
+                score = self.aspirationSearch(gs, validMoves, depth, self.searchScore if depth > 1 else None)
+            except SearchTimeout:
+                # Take back the moves the unfinished iteration was in the middle of
+                while len(gs.moveLog) > moveLogLength:
+                    gs.undoMove()
+                break
+            if self.nextMove is not None:
+                bestMove = self.nextMove
+            self.searchScore = score
+            self.principalVariation = self.getPrincipalVariation(gs)
+            if infoCallback is not None:
+                infoCallback(depth, score, self.counter, time.perf_counter() - startTime,
+                             [move for key, move in self.principalVariation])
+            if abs(score) >= MATE_THRESHOLD:
+                break # Found a forced mate, searching deeper won't change the move
+            if self.searchDeadline is not None and time.perf_counter() - startTime > (self.searchDeadline - startTime) / 2:
+                break # The next iteration takes several times longer than this one, it wouldn't finish
+        self.searchDeadline = None
+        if bestMove is None and validMoves:
+            bestMove = validMoves[0] # Stopped before the first iteration had a move
+        return bestMove
+
+    """
+    Search the root to depth with a window around guess, the score of the last iteration, and widen the side of the
+    window the score falls out of until it lands inside. Without a guess the window is the full one.
+    """
+    def aspirationSearch(self, gs, validMoves, depth, guess):
+        turnMultiplier = 1 if gs.whiteToMove else -1
+        if guess is None or abs(guess) >= MATE_THRESHOLD:
+            self.nextMove = None
+            return self.findMoveNegaMaxAlphaBeta(gs, validMoves, depth, -CHECKMATE, CHECKMATE, turnMultiplier)
+        window = ASPIRATION_WINDOW
+        alpha = max(guess - window, -CHECKMATE)
+        beta = min(guess + window, CHECKMATE)
+        while True:
+            self.nextMove = None
+            score = self.findMoveNegaMaxAlphaBeta(gs, validMoves, depth, alpha, beta, turnMultiplier)
+            window *= 2
+            if score <= alpha and alpha > -CHECKMATE:
+                alpha = max(score - window, -CHECKMATE)
+            elif score >= beta and beta < CHECKMATE:
+                beta = min(score + window, CHECKMATE)
+            else:
+                return score
+
+    """
+    Searches a single root move to depth in a worker process of parallelRootSearch, with the position sent as a
+    GameState.serialize string so it is cheap to pass. Every move is a new search for the worker's searcher, so its
+    table ages and its history decays like they do between the searches of one process. Returns the move code,
+    its score for the side to move at the root and the number of nodes searched.
+    """
+    def searchRootMove(self, gameStateClass, state, moveCode, depth, alpha, beta):
+        gs = gameStateClass.deserialize(state)
+        turnMultiplier = 1 if gs.whiteToMove else -1
+        self.newSearch(gs)
+        self.depth = depth
+        self.searchDeadline = None
+        gs.makeMove(Move.fromCode(moveCode, gs.board))
+        score = -self.findMoveNegaMaxAlphaBeta(gs, None, depth - 1, -beta, -alpha, -turnMultiplier, 1)
+        return moveCode, score, self.counter
+
+    """
+    Fixed depth search with the root moves shared out between processes worker processes, all the cores by default.
+    The most promising root move is searched first in this process, following the principal variation of the last
+    search, the others are then searched in parallel against its score, each worker keeping its own Searcher
+    between the moves and searches it gets.
+    """
+    def parallelRootSearch(self, gs, validMoves, depth, processes = None):
+        if processes is None:
+            processes = os.cpu_count() or 1
+        if self.searchPool is None or self.searchPoolSize != processes:
+            self.closeSearchPool()
+            # Spawned rather than forked, the search often runs in a thread and a fork copies the locks other
+            # threads hold, like the one on stdin the UCI loop waits on, into workers that then hang on them
+            self.searchPool = multiprocessing.get_context("spawn").Pool(processes, initializer = initSearchWorker)
+            self.searchPoolSize = processes
+        if len(validMoves) == 0:
+            self.nextMove = None
+            return None
+        random.shuffle(validMoves)
+        self.newSearch(gs)
+        self.orderMoves(validMoves, 0, self.principalVariation[0][1].moveID if self.principalVariation else None)
+        gameStateClass = type(gs)
+        state = gs.serialize()
+
+        self.depth = depth
+        self.searchDeadline = None
+        self.nextMove = validMoves[0]
+        moveLogLength = len(gs.moveLog)
+        gs.makeMove(self.nextMove)
+        try:
+            self.searchScore = -self.findMoveNegaMaxAlphaBeta(gs, None, depth - 1, -CHECKMATE, CHECKMATE,
+                                                              -1 if gs.whiteToMove else 1, 1)
+        except SearchTimeout:
+            # Stopped before the first move was searched, the best guess is the move ordering put first
+            return self.nextMove
+        finally:
+            while len(gs.moveLog) > moveLogLength:
+                gs.undoMove()
+        self.pvTable[0] = [self.nextMove] + self.pvTable[1]
+        tasks = [(gameStateClass, state, move.encode(), depth, self.searchScore, CHECKMATE) for move in validMoves[1:]]
+        for moveCode, score, moveNodes in self.searchPool.starmap(searchRootMove, tasks):
+            self.counter += moveNodes
+            if score > self.searchScore: # A move that only ties failed low against the first one, so the first is kept
+                self.searchScore = score
+                self.nextMove = next(move for move in validMoves if move.encode() == moveCode)
+                self.pvTable[0] = [self.nextMove] # The worker's line stays in the worker
+        self.principalVariation = self.getPrincipalVariation(gs)
+        return self.nextMove
+
+    """
+    Stop the worker processes of parallelRootSearch, the next parallel search starts new ones with empty tables
+    """
+    def closeSearchPool(self):
+        if self.searchPool is not None:
+            self.searchPool.terminate()
+            self.searchPool.join()
+        self.searchPool = None
+        self.searchPoolSize = 0
+
+    """
+    The best line of the search that just finished, from the triangular PV table. Returns (Zobrist key, move)
+    pairs, the key being the position the move is played from.
+    """
+    def getPrincipalVariation(self, gs):
+        line = []
+        for move in self.pvTable[0] or ([self.nextMove] if self.nextMove is not None else []):
+            line.append((gs.zobristKey, move))
+            gs.makeMove(move)
+        for i in range(len(line)):
+            gs.undoMove()
+        return line
+
+    """
+    Share of the beta cutoffs that happened on the first move searched, the closer to 1 the better the ordering
+    """
+    def getCutoffRate(self):
+        return self.firstMoveCutoffs / self.betaCutoffs if self.betaCutoffs else 0
+
+    """
+    Sorts the moves of a node at the given ply so the most promising ones get searched first: the hash move, the
+    captures and promotions by MVV-LVA, the killers, then the quiet moves by history. Used for the root moves, the
+    evasions in check and the nodes given their moves, the other nodes get theirs in stages from pickMoves.
+    """
+    def orderMoves(self, moves, ply, hashMoveID):
+        killers = self.killerMoves[ply]
+        historyTable = self.historyTable
+
+        def moveScore(move):
+            if move.moveID == hashMoveID:
+                return HASH_MOVE_SCORE
+            if move.isCapture or move.isPawnPromotion:
+                return CAPTURE_SCORE + mvvLvaScore(move)
+            if move.moveID in killers:
+                return KILLER_SCORE - killers.index(move.moveID)
+            return min(historyTable.get((move.pieceMoved, move.endRow, move.endCol), 0), KILLER_SCORE - MAX_KILLERS)
+
+        moves.sort(key = moveScore, reverse = True)
+
+    """
+    Yields the moves of a node one stage at a time, so a node that cuts off early never generates the rest: the hash
+    move, the winning captures and promotions, the killers, the other quiet moves by history and last the losing
+    captures, see isLosingCapture. The moves are pseudo-legal, the search checks them with isLegal. In check all the
+    evasions come at once, ordered as usual.
+    """
+    def pickMoves(self, gs, ply, hashMove, inCheck):
+        hashMoveID = hashMove.moveID if hashMove is not None else None
+        if inCheck:
+            moves = gs.getCaptureMoves()
+            self.orderMoves(moves, ply, hashMoveID)
+            yield from moves
+            return
+        if hashMove is not None:
+            yield hashMove
+
+        captures = gs.getCaptureMoves()
+        captures.sort(key = mvvLvaScore, reverse = True)
+        losingCaptures = []
+        for move in captures:
+            if move.moveID == hashMoveID:
+                continue
+            if isLosingCapture(gs, move):
+                losingCaptures.append(move)
+            else:
+                yield move
+
+        # The killers are only known as moveIDs, they are taken from the quiet moves once those are generated
+        quietMoves = gs.getQuietMoves()
+        killers = self.killerMoves[ply]
+        for killerID in killers:
+            if killerID != hashMoveID:
+                for move in quietMoves:
+                    if move.moveID == killerID:
+                        yield move
+                        break
+        historyTable = self.historyTable
+        quietMoves = [move for move in quietMoves if move.moveID != hashMoveID and move.moveID not in killers]
+        quietMoves.sort(key = lambda move: historyTable.get((move.pieceMoved, move.endRow, move.endCol), 0), reverse = True)
+        yield from quietMoves
+        yield from losingCaptures
+
+    """
+    Remember a quiet move that caused a beta cutoff as a killer for its ply and in the history table
+    """
+    def storeCutoffMove(self, move, ply, depth):
+        killers = self.killerMoves[ply]
+        if move.moveID not in killers:
+            killers.insert(0, move.moveID)
+            del killers[MAX_KILLERS:]
+        key = (move.pieceMoved, move.endRow, move.endCol)
+        self.historyTable[key] = self.historyTable.get(key, 0) + depth * depth
+
+    """
+    Same as findMoveNegaMax but with alpha beta pruning implemented. pvNode is False for the nodes searched with a
+    null window, which only have to prove a move is no better than alpha.
+    """
+    def findMoveNegaMaxAlphaBeta(self, gs, validMoves, depth, alpha, beta, turnMultiplier, ply = 0, pvNode = True):
+        self.counter += 1
+        if self.counter & TIME_CHECK_NODES == 0 and self.depth > 1 and self.searchStopped():
+            raise SearchTimeout() # Depth 1 always finishes so there is a move to play
+        alphaOriginal = alpha
+        pvTable = self.pvTable
+        pvTable[ply] = [] # Filled in when a move lands inside the window
+        # A position that was on the board before is a draw, either side can keep repeating it, and so is the
+        # hundredth half move without a capture or pawn move. The root is always searched to set nextMove.
+        if ply != 0 and gs.halfmoveClock >= 4 and (gs.halfmoveClock >= 100 or gs.repetitionCount() > 0):
+            return STALEMATE
+        # Look the position up in the transposition table, the root is always searched to set nextMove
+        entry = self.transpositionTable.probe(gs.zobristKey) if USE_TRANSPOSITION_TABLE else None
+        if entry is not None and ply != 0 and (not pvNode or not USE_PRINCIPAL_VARIATION_SEARCH):
+            if entry[1] >= depth:
+                score, flag = scoreFromTable(entry[2], ply), entry[3]
+                if flag == EXACT:
+                    return score
+                elif flag == LOWERBOUND and score > alpha:
+                    alpha = score
+                elif flag == UPPERBOUND and score < beta:
+                    beta = score
+                if alpha >= beta:
+                    return score
+
+        if depth == 0:
+            if USE_QUIESCENCE:
+                return self.quiescenceSearch(gs, alpha, beta, turnMultiplier, ply)
+            if not gs.hasLegalMove():
+                return -CHECKMATE + ply if gs.inCheck else STALEMATE
+            return turnMultiplier * scoreBoard(gs)
+
+        # Null move pruning: if passing the turn still fails high in a reduced search, a real move would too.
+        # Not in check, on the principal variation, right after another null move or without pieces (zugzwang).
+        if USE_NULL_MOVE and depth >= NULL_MOVE_MIN_DEPTH and ply != 0 and not pvNode and \
+                gs.moveLog[-1] is not None and not gs.updateInCheck() and turnMultiplier * scoreBoard(gs) >= beta and \
+                gs.hasNonPawnMaterial():
+            gs.makeNullMove()
+            score = -self.findMoveNegaMaxAlphaBeta(gs, None, depth - 1 - NULL_MOVE_REDUCTION, -beta, -beta + NULL_WINDOW,
+                                                   -turnMultiplier, ply + 1, False)
+            gs.undoMove()
+            if score >= beta:
+                return beta if score >= MATE_THRESHOLD else score # A mate found without moving can't be trusted
+
+        # The move the last iteration found best here goes first when the node is on its principal variation
+        pvMove = None
+        principalVariation = self.principalVariation
+        if ply < len(principalVariation) and principalVariation[ply][0] == gs.zobristKey:
+            pvMove = principalVariation[ply][1]
+        if validMoves is None and USE_MOVE_ORDERING:
+            # The moves are generated a stage at a time after the table lookup, as the search gets to them
+            inCheck = gs.updateInCheck()
+            hashMove = pvMove
+            if hashMove is None and entry is not None and entry[4] is not None:
+                hashMove = gs.getMoveFromID(entry[4])
+            moves = self.pickMoves(gs, ply, hashMove, inCheck)
+        else:
+            if validMoves is None:
+                validMoves = gs.getPseudoLegalMoves()
+            inCheck = gs.updateInCheck()
+            if USE_MOVE_ORDERING:
+                self.orderMoves(validMoves, ply, pvMove.moveID if pvMove is not None else entry[4] if entry is not None else None)
+            elif pvMove is not None and pvMove in validMoves:
+                validMoves.remove(pvMove)
+                validMoves.insert(0, pvMove)
+            moves = validMoves
+
+        maxScore = -CHECKMATE
+        bestMove = None
+        legalMoves = 0
+        for move in moves:
+            # Legality is only checked once a move is reached, the moves after a cutoff never are
+            if not gs.isLegal(move):
+                continue
+            legalMoves += 1
+            gs.makeMove(move)
+            givesCheck = (USE_CHECK_EXTENSIONS or USE_LATE_MOVE_REDUCTIONS) and gs.updateInCheck()
+            newDepth = depth - 1
+            if givesCheck and USE_CHECK_EXTENSIONS and ply + depth < 2 * self.depth: # No line goes past twice the depth
+                newDepth += 1
+            if legalMoves == 1 or not USE_PRINCIPAL_VARIATION_SEARCH:
+                score = -self.findMoveNegaMaxAlphaBeta(gs, None, newDepth, -beta, - alpha, -turnMultiplier, ply + 1, pvNode)
+            else:
+                # Late quiet moves are searched a ply less first, they rarely turn out best
+                reduction = 0
+                if USE_LATE_MOVE_REDUCTIONS and legalMoves > LMR_MOVES and depth >= LMR_MIN_DEPTH and not inCheck and \
+                        not givesCheck and not move.isCapture and not move.isPawnPromotion and move.moveID not in self.killerMoves[ply]:
+                    reduction = 1
+                # Only prove the move is no better than alpha, search it properly if it turns out to be
+                score = -self.findMoveNegaMaxAlphaBeta(gs, None, newDepth - reduction, -alpha - NULL_WINDOW, -alpha, -turnMultiplier, ply + 1,
+                                                        False)
+                if reduction and score > alpha:
+                    score = -self.findMoveNegaMaxAlphaBeta(gs, None, newDepth, -alpha - NULL_WINDOW, -alpha, -turnMultiplier, ply + 1,
+                                                           False)
+                if alpha < score < beta:
+                    score = -self.findMoveNegaMaxAlphaBeta(gs, None, newDepth, -beta, -alpha, -turnMultiplier, ply + 1, pvNode)
+            if score > alpha:
+                pvTable[ply] = [move] + pvTable[ply + 1]
+            if score > maxScore:
+                maxScore = score
+                bestMove = move
+                if ply == 0:
+                    self.nextMove = move
+            gs.undoMove()
+            gs.inCheck = inCheck # The search below set it for the positions it looked at
+            if maxScore > alpha: # Pruning happens
+                alpha = maxScore
+            if alpha >= beta:
+                self.betaCutoffs += 1
+                if legalMoves == 1:
+                    self.firstMoveCutoffs += 1
+                if not move.isCapture:
+                    self.storeCutoffMove(move, ply, depth)
+                break
+        if legalMoves == 0:
+            maxScore = -CHECKMATE + ply if inCheck else STALEMATE
+
+        # Store the result, the score is only a bound if it fell outside the window
+        if USE_TRANSPOSITION_TABLE:
+            if maxScore <= alphaOriginal:
+                flag = UPPERBOUND
+            elif maxScore >= beta:
+                flag = LOWERBOUND
+            else:
+                flag = EXACT
+            self.transpositionTable.store(gs.zobristKey, depth, scoreToTable(maxScore, ply), flag,
+                                          None if bestMove is None else bestMove.moveID)
+        return maxScore
+
+    """
+    Keeps searching captures and promotions past the horizon so a position is only scored once it is quiet.
+    The side to move may stand pat on the static score instead of capturing, unless it is in check, then
+    every evasion is searched. ply counts from the root like in findMoveNegaMaxAlphaBeta, for the mate scores.
+    """
+    def quiescenceSearch(self, gs, alpha, beta, turnMultiplier, ply, qPly = 0):
+        if qPly > 0: # The node at depth 0 was already counted by findMoveNegaMaxAlphaBeta
+            self.counter += 1
+        if self.counter & TIME_CHECK_NODES == 0 and self.depth > 1 and self.searchStopped():
+            raise SearchTimeout()
+        moves = getCapturesAndChecks(gs) if qPly < QUIESCENCE_CHECK_PLIES else gs.getCaptureMoves()
+        inCheck = gs.inCheck
+        if inCheck:
+            if len(moves) == 0:
+                return -CHECKMATE + ply
+            standPat = maxScore = -CHECKMATE + ply
+        else:
+            # Without a capture it could be stalemate, only looked for at the horizon like the search before did
+            if qPly == 0 and len(moves) == 0 and not gs.hasLegalMove():
+                return STALEMATE
+            standPat = maxScore = turnMultiplier * scoreBoard(gs)
+            if standPat >= beta:
+                return standPat
+            if standPat > alpha:
+                alpha = standPat
+
+        moves.sort(key = mvvLvaScore, reverse = True)
+        for move in moves:
+            # Delta pruning, even winning the piece for free wouldn't get near alpha
+            if not inCheck and (move.isCapture or move.isPawnPromotion):
+                gain = pieceScores[move.pieceCaptured[1]] if move.isCapture else 0
+                if move.isPawnPromotion:
+                    gain += pieceScores['Q'] - pieceScores['p']
+                gain *= PAWN_VALUE
+                if standPat + gain + DELTA_MARGIN <= alpha:
+                    continue
+                # Losing the exchange can't do better than standing pat
+                if USE_STATIC_EXCHANGE and isLosingCapture(gs, move):
+                    continue
+            gs.makeMove(move)
+            score = -self.quiescenceSearch(gs, -beta, -alpha, -turnMultiplier, ply + 1, qPly + 1)
+            gs.undoMove()
+            if score > maxScore:
+                maxScore = score
+            if maxScore > alpha:
+                alpha = maxScore
+            if alpha >= beta:
+                break
+        return maxScore
+
+
+"""
+Per process searcher of the parallelRootSearch workers, made when the worker starts and kept for every root move it gets
+"""
+workerSearcher = None
+
+def initSearchWorker():
+    global workerSearcher
+    workerSearcher = Searcher()
+
+"""
+Runs Searcher.searchRootMove in a worker process of parallelRootSearch
+"""
+def searchRootMove(gameStateClass, state, moveCode, depth, alpha, beta):
+    return workerSearcher.searchRootMove(gameStateClass, state, moveCode, depth, alpha, beta)
+
+"""
+Captures and promotions plus the quiet moves that give check, every move when in check
+"""
+def getCapturesAndChecks(gs):
+    moves = gs.getValidMoves()
+    if gs.inCheck:
+        return moves
+    tacticalMoves = []
+    for move in moves:
+        if move.isCapture or move.isPawnPromotion:
+            tacticalMoves.append(move)
+            continue
         gs.makeMove(move)
-        nextMoves = gs.getValidMoves()
-        score = -findMoveNegaMaxAlphaBeta(gs, nextMoves, depth - 1, -beta, - alpha, -turnMultiplier)
-        if score > maxScore:
-            maxScore = score
-            if depth == DEPTH:
-                nextMove = move
+        kingRow, kingCol = gs.whiteKingLocation if gs.whiteToMove else gs.blackKingLocation
+        givesCheck = gs.squareUnderAttack(kingRow, kingCol)
         gs.undoMove()
-        if maxScore > alpha: # Pruning happens
-            alpha = maxScore
-        if alpha >= beta:
-            break
-    return maxScore
+        if givesCheck:
+            tacticalMoves.append(move)
+    return tacticalMoves
 
 def scoreBoard(gs):
     if gs.checkmate:
@@ -295,24 +834,10 @@ def scoreBoard(gs):
     elif gs.stalemate:
         return STALEMATE # Draw
 
-    score = 0
-    for row in range(len(gs.board)):
-        for col in range(len(gs.board[row])):
-            square = gs.board[row][col]
-            if square != "--":
-                # Score it possitionally
-                piecePositionScore = 0
-                if square[1] == 'p' or square[1] == 'K': # For pawns
-                    piecePositionScore = piecePositionScores[square][row][col]
-                else: # For other pieces
-                    piecePositionScore = piecePositionScores[square[1]][row][col]
-
-                if square[0] == "w":
-                    score += pieceScores[square[1]] + piecePositionScore * 0.1
-                elif square[0] == "b":
-                    score -= pieceScores[square[1]] + piecePositionScore * 0.1
-
-    return score   
+    # The midgame and endgame totals kept up to date by the GameState, blended by how much material is left.
+    # Rounded towards zero so a position and its colour flipped mirror score the same.
+    phase = taperedPhases[gs.phase]
+    return int((gs.midgame * phase + gs.endgame * (MAX_PHASE - phase)) / MAX_PHASE)
 
 """
 Score the board based on material
@@ -0,0 +1,199 @@
+"""
+Batch analysis of the positions in an EPD or FEN file (one position per line). The file is read lazily, the
+positions are searched by a pool of worker processes and every result (best move, score, nodes, time) is
+appended to a JSONL or CSV file as soon as its chunk is done. A position the search fails on gets an error row.
+A checkpoint file next to the output records the input and how far the run got, so an interrupted run continues
+where it stopped with --resume.
+Run it with: python ChessBatch.py positions.epd results.jsonl [--depth N | --movetime MS] [--processes N] [--resume]
+"""
+
+import argparse
+import csv
+import io
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+import time
+import ChessAI
+from ChessBitboard import BitboardGameState
+from ChessUCI import uciMove, uciScore
+
+CHUNK_SIZE = 16 # Positions handed to each worker process per chunk
+FIELDS = ["line", "id", "fen", "bestmove", "score", "pv", "depth", "nodes", "time", "nps", "expected", "solved", "error"]
+
+"""
+Reads the positions of an EPD or FEN file one line at a time, skipping the first skipLines lines.
+Yields (line number, FEN, EPD operations). EPD lines have only four position fields, the move counters are added.
+"""
+def readPositions(path, skipLines = 0):
+    with open(path) as positionFile:
+        for lineNumber, line in enumerate(itertools.islice(positionFile, skipLines, None), skipLines + 1):
+            fields = line.split()
+            if len(fields) < 4 or line.startswith("#"):
+                yield lineNumber, None, {}
+                continue
+            if len(fields) >= 6 and fields[4].isdigit() and fields[5].isdigit(): # Plain FEN
+                yield lineNumber, " ".join(fields[:6]), {}
+                continue
+            operations = {}
+            for operation in " ".join(fields[4:]).split(";"):
+                parts = operation.strip().split(None, 1)
+                if parts:
+                    operations[parts[0]] = parts[1].strip('"') if len(parts) > 1 else ""
+            yield lineNumber, " ".join(fields[:4]) + " 0 1", operations
+
+# Searcher of the worker process, kept for all the positions it analyses
+workerSearcher = None
+
+"""
+Runs once in every worker process
+"""
+def initWorker():
+    global workerSearcher
+    workerSearcher = ChessAI.Searcher()
+
+"""
+Search one position in a worker process and return its result row, or None for a line that isn't a position.
+A position the search fails on gets an error row, so one bad position doesn't stop the whole run.
+"""
+def analysePosition(task):
+    lineNumber, fen, operations, depth, moveTime = task
+    if fen is None:
+        return None
+    row = {"line" : lineNumber, "id" : operations.get("id", ""), "fen" : fen}
+    try:
+        gs = BitboardGameState(fen)
+    except ValueError:
+        row["bestmove"] = "invalid"
+        return row
+    try:
+        searchPosition(gs, row, operations, depth, moveTime)
+    except Exception as error:
+        row["bestmove"] = "error"
+        row["error"] = "%s: %s" % (type(error).__name__, error)
+    return row
+
+"""
+Search gs with the worker's searcher and fill in the result fields of row
+"""
+def searchPosition(gs, row, operations, depth, moveTime):
+    searcher = workerSearcher
+    validMoves = gs.getValidMoves()
+    startTime = time.perf_counter()
+    if len(validMoves) == 0:
+        bestMove = None
+        searcher.counter = 0
+        searcher.searchScore = -ChessAI.CHECKMATE if gs.inCheck else ChessAI.STALEMATE
+    elif moveTime is not None:
+        completedDepths = []
+        bestMove = searcher.iterativeDeepeningAlgorithm(gs, validMoves, moveTime = moveTime,
+            infoCallback = lambda depth, *info: completedDepths.append(depth))
+        depth = completedDepths[-1] if completedDepths else 0
+    else:
+        bestMove = searcher.alphaBetaNegaMaxAlgorithm(gs, validMoves, depth)
+    seconds = time.perf_counter() - startTime
+    pv = [move for key, move in searcher.principalVariation] if bestMove is not None else []
+    row.update({"bestmove" : uciMove(bestMove) if bestMove is not None else "0000",
+                "score" : uciScore(searcher.searchScore),
+                "pv" : " ".join(uciMove(move) for move in pv),
+                "depth" : depth, "nodes" : searcher.counter, "time" : round(seconds, 3),
+                "nps" : int(searcher.counter / max(seconds, 1e-9))})
+    if "bm" in operations and bestMove is not None:
+        row["expected"] = operations["bm"]
+        row["solved"] = any(sanMatches(san, bestMove) for san in operations["bm"].split())
+
+"""
+If a move in standard algebraic notation (as EPD bm operations are written) is move. Only the piece and
+the end square are compared, which is enough to tell the moves of a position apart in practice.
+"""
+def sanMatches(san, move):
+    san = san.rstrip("+#!?").split("=")[0]
+    if san in ("O-O", "0-0", "O-O-O", "0-0-0"):
+        return move.isCastleMove and (move.endCol == 6) == (len(san) == 3)
+    piece = san[0] if san[0] in "KQRBN" else "p"
+    return move.pieceMoved[1] == piece and san[-2:] == move.getRankFile(move.endRow, move.endCol)
+
+def formatRow(row, outputFormat):
+    if outputFormat == "jsonl":
+        return json.dumps(row) + "\n"
+    text = io.StringIO()
+    csv.DictWriter(text, FIELDS, lineterminator = "\n").writerow(row)
+    return text.getvalue()
+
+"""
+Record that the first lines of the input are done and the output file is outputBytes long. Written to a
+temporary file first so an interruption never leaves a half written checkpoint.
+"""
+def writeCheckpoint(checkpointPath, inputPath, lines, outputBytes):
+    with open(checkpointPath + ".tmp", "w") as checkpointFile:
+        json.dump({"input" : os.path.abspath(inputPath), "lines" : lines, "outputBytes" : outputBytes}, checkpointFile)
+    os.replace(checkpointPath + ".tmp", checkpointPath)
+
+"""
+Analyse every position of inputPath into outputPath and return (positions, nodes, seconds). Raises ValueError
+when asked to resume from the checkpoint of a run over another input file.
+"""
+def runBatch(inputPath, outputPath, depth = 3, moveTime = None, processes = None, resume = False, outputFormat = None):
+    outputFormat = outputFormat or ("csv" if outputPath.endswith(".csv") else "jsonl")
+    checkpointPath = outputPath + ".checkpoint"
+    skipLines = 0
+    if resume and os.path.exists(checkpointPath):
+        with open(checkpointPath) as checkpointFile:
+            checkpoint = json.load(checkpointFile)
+        if os.path.abspath(checkpoint["input"]) != os.path.abspath(inputPath):
+            raise ValueError("%s is the checkpoint of a run over %s, not %s" % (checkpointPath, checkpoint["input"], inputPath))
+        skipLines = checkpoint["lines"]
+        # Results written after the last checkpoint are searched again, drop them
+        with open(outputPath, "r+") as outputFile:
+            outputFile.truncate(checkpoint["outputBytes"])
+    outputFile = open(outputPath, "a" if skipLines else "w", newline = "")
+    if not skipLines and outputFormat == "csv":
+        outputFile.write(",".join(FIELDS) + "\n")
+
+    positions = 0
+    nodes = 0
+    startTime = time.perf_counter()
+    tasks = ((lineNumber, fen, operations, depth, moveTime) for lineNumber, fen, operations in readPositions(inputPath, skipLines))
+    processes = processes or os.cpu_count() or 1
+    with multiprocessing.Pool(processes, initializer = initWorker) as pool:
+        linesDone = skipLines
+        while True:
+            chunk = list(itertools.islice(tasks, CHUNK_SIZE * processes))
+            if not chunk:
+                break
+            for row in pool.imap(analysePosition, chunk):
+                if row is None:
+                    continue
+                outputFile.write(formatRow(row, outputFormat))
+                positions += 1
+                nodes += row.get("nodes", 0)
+            outputFile.flush()
+            linesDone = chunk[-1][0]
+            writeCheckpoint(checkpointPath, inputPath, linesDone, outputFile.tell())
+            seconds = time.perf_counter() - startTime
+            sys.stderr.write("%d lines done, %.1f positions/s\n" % (linesDone, positions / max(seconds, 1e-9)))
+    outputFile.close()
+    return positions, nodes, time.perf_counter() - startTime
+
+def main():
+    parser = argparse.ArgumentParser(description = "Analyse the positions of an EPD or FEN file")
+    parser.add_argument("input", help = "EPD or FEN file, one position per line")
+    parser.add_argument("output", help = "results file, .jsonl or .csv")
+    parser.add_argument("--depth", type = int, default = 3, help = "fixed search depth (default 3)")
+    parser.add_argument("--movetime", type = int, help = "milliseconds per position instead of a fixed depth")
+    parser.add_argument("--processes", type = int, help = "worker processes, all the cores by default")
+    parser.add_argument("--format", choices = ("jsonl", "csv"), help = "output format, from the file name by default")
+    parser.add_argument("--resume", action = "store_true", help = "continue from the checkpoint of an interrupted run")
+    args = parser.parse_args()
+    try:
+        positions, nodes, seconds = runBatch(args.input, args.output, args.depth, args.movetime, args.processes, args.resume,
+                                             args.format)
+    except ValueError as error:
+        parser.error(str(error))
+    print("%d positions in %.2fs, %.2f positions per second, %d nodes, %d nodes per second" % (
+        positions, seconds, positions / max(seconds, 1e-9), nodes, nodes / max(seconds, 1e-9)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+"""
+Headless benchmark for the search in ChessAI. It plays a few fixed openings from the start position and
+reports the node count and wall-clock time of alphaBetaNegaMaxAlgorithm with one search feature switched off and on.
+Run it with: python ChessBench.py [max depth] [feature], where feature is one of the keys of FEATURES.
+python ChessBench.py [max depth] parallel [max processes] reports the speedup of parallelRootSearch instead.
+python ChessBench.py makemove [rounds] times makeMove/undoMove pairs on both game state classes.
+python ChessBench.py [max depth] ebf reports the effective branching factor with the selective search switched off and on.
+"""
+
+import os
+import random
+import sys
+import time
+import ChessAI
+from ChessEngine import GameState, Move
+from ChessBitboard import BitboardGameState
+
+# Search features that can be compared, each mapped to the ChessAI switch that turns it on
+FEATURES = {
+    "tt" : "USE_TRANSPOSITION_TABLE",
+    "ordering" : "USE_MOVE_ORDERING",
+    "quiescence" : "USE_QUIESCENCE",
+    "nullmove" : "USE_NULL_MOVE",
+    "lmr" : "USE_LATE_MOVE_REDUCTIONS",
+    "checkext" : "USE_CHECK_EXTENSIONS",
+    "see" : "USE_STATIC_EXCHANGE",
+}
+
+# The switches that make the search selective, compared together by the ebf mode
+SELECTIVE_SWITCHES = ["USE_NULL_MOVE", "USE_LATE_MOVE_REDUCTIONS", "USE_CHECK_EXTENSIONS"]
+
+# Fixed positions given as the moves that lead to them from the starting position
+BENCH_POSITIONS = {
+    "Start position" : [],
+    "Italian game" : ["e2e4", "e7e5", "g1f3", "b8c6", "f1c4", "f8c5", "c2c3", "g8f6"],
+    "Queen's gambit declined" : ["d2d4", "d7d5", "c2c4", "e7e6", "b1c3", "g8f6", "c1g5", "f8e7"],
+    "Sicilian open" : ["e2e4", "c7c5", "g1f3", "d7d6", "d2d4", "c5d4", "f3d4", "g8f6", "b1c3", "a7a6"],
+}
+
+"""
+Build a GameState by playing moves written as start and end squares, for example "e2e4"
+"""
+def setupPosition(moves, gameStateClass = GameState):
+    gs = gameStateClass()
+    for text in moves:
+        startSq = (Move.ranksToRows[text[1]], Move.filesToCols[text[0]])
+        endSq = (Move.ranksToRows[text[3]], Move.filesToCols[text[2]])
+        for move in gs.getValidMoves():
+            if (move.startRow, move.startCol) == startSq and (move.endRow, move.endCol) == endSq:
+                gs.makeMove(move)
+                break
+        else:
+            raise ValueError("Illegal move in bench position: " + text)
+    return gs
+
+"""
+Search a position once with a ChessAI switch set to enabled and return the number of nodes, the time it took
+and the share of beta cutoffs found on the first move
+"""
+def searchPosition(moves, depth, switch, enabled):
+    gs = setupPosition(moves)
+    validMoves = gs.getValidMoves()
+    default = getattr(ChessAI, switch)
+    setattr(ChessAI, switch, enabled)
+    searcher = ChessAI.Searcher() # Empty tables, so no measurement profits from the one before
+    random.seed(0) # alphaBetaNegaMaxAlgorithm shuffles the root moves
+    startTime = time.perf_counter()
+    searcher.alphaBetaNegaMaxAlgorithm(gs, validMoves, depth)
+    seconds = time.perf_counter() - startTime
+    setattr(ChessAI, switch, default)
+    return searcher.counter, seconds, searcher.getCutoffRate()
+
+"""
+Time parallelRootSearch at fixed depth with 1, 2, 4 ... up to maxProcesses processes against the serial search
+"""
+def benchParallel(maxDepth, maxProcesses):
+    processCounts = [1]
+    while processCounts[-1] * 2 <= maxProcesses:
+        processCounts.append(processCounts[-1] * 2)
+    if processCounts[-1] != maxProcesses:
+        processCounts.append(maxProcesses)
+    print("%d cores available" % (os.cpu_count() or 1))
+    print("%-26s %5s %9s %10s %9s %10s %7s" % ("Position", "Depth", "Processes", "Nodes", "Time", "NPS", "Speedup"))
+    for name, moves in BENCH_POSITIONS.items():
+        for depth in range(3, maxDepth + 1):
+            nodes, serialSeconds, rate = searchPosition(moves, depth, "USE_TRANSPOSITION_TABLE", True)
+            print("%-26s %5d %9s %10d %8.2fs %10d %6.2fx" % (name, depth, "serial", nodes, serialSeconds, nodes / serialSeconds, 1))
+            for processes in processCounts:
+                gs = setupPosition(moves)
+                validMoves = gs.getValidMoves()
+                searcher = ChessAI.Searcher() # Its workers start with empty tables too
+                searcher.parallelRootSearch(gs, validMoves, 1, processes) # Start the workers outside the timing
+                random.seed(0)
+                startTime = time.perf_counter()
+                searcher.parallelRootSearch(gs, validMoves, depth, processes)
+                seconds = time.perf_counter() - startTime
+                searcher.closeSearchPool()
+                print("%-26s %5d %9d %10d %8.2fs %10d %6.2fx" % (name, depth, processes, searcher.counter, seconds,
+                    searcher.counter / seconds, serialSeconds / seconds))
+
+"""
+Search each bench position at every depth up to maxDepth with the selective switches off and then on and report
+the effective branching factor, the nodes at one depth divided by the nodes at the depth below
+"""
+def benchBranching(maxDepth):
+    defaults = [getattr(ChessAI, switch) for switch in SELECTIVE_SWITCHES]
+    print("%-26s %5s %10s %6s %10s %6s" % ("Position", "Depth", "Nodes", "EBF", "Sel nodes", "EBF"))
+    totals = {False : [0] * (maxDepth + 1), True : [0] * (maxDepth + 1)}
+    for name, moves in BENCH_POSITIONS.items():
+        previous = {False : 0, True : 0}
+        for depth in range(1, maxDepth + 1):
+            nodes = {}
+            for enabled in (False, True):
+                for switch in SELECTIVE_SWITCHES:
+                    setattr(ChessAI, switch, enabled)
+                nodes[enabled] = searchPosition(moves, depth, SELECTIVE_SWITCHES[0], enabled)[0]
+                totals[enabled][depth] += nodes[enabled]
+            if depth > 1:
+                print("%-26s %5d %10d %6.2f %10d %6.2f" % (name, depth, nodes[False], nodes[False] / max(previous[False], 1),
+                    nodes[True], nodes[True] / max(previous[True], 1)))
+            previous = nodes
+    for switch, default in zip(SELECTIVE_SWITCHES, defaults):
+        setattr(ChessAI, switch, default)
+    for depth in range(2, maxDepth + 1):
+        print("%-26s %5d %10d %6.2f %10d %6.2f" % ("Total", depth, totals[False][depth],
+            totals[False][depth] / max(totals[False][depth - 1], 1), totals[True][depth],
+            totals[True][depth] / max(totals[True][depth - 1], 1)))
+
+"""
+Make and undo every valid move of each bench position rounds times and report the pairs per second
+"""
+def benchMakeMove(rounds):
+    print("%-26s %-18s %10s %9s %12s" % ("Position", "Game state", "Pairs", "Time", "Pairs/s"))
+    for name, moves in BENCH_POSITIONS.items():
+        for gameStateClass in (GameState, BitboardGameState):
+            gs = setupPosition(moves, gameStateClass)
+            validMoves = gs.getValidMoves()
+            makeMove = gs.makeMove
+            undoMove = gs.undoMove
+            startTime = time.perf_counter()
+            for _ in range(rounds):
+                for move in validMoves:
+                    makeMove(move)
+                    undoMove()
+            seconds = time.perf_counter() - startTime
+            pairs = rounds * len(validMoves)
+            print("%-26s %-18s %10d %8.2fs %12d" % (name, gameStateClass.__name__, pairs, seconds, pairs / seconds))
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "makemove":
+        benchMakeMove(int(sys.argv[2]) if len(sys.argv) > 2 else 2000)
+        return
+    maxDepth = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    feature = sys.argv[2] if len(sys.argv) > 2 else "tt"
+    if feature == "parallel":
+        benchParallel(maxDepth, int(sys.argv[3]) if len(sys.argv) > 3 else os.cpu_count() or 1)
+        return
+    if feature == "ebf":
+        benchBranching(maxDepth)
+        return
+    switch = FEATURES[feature]
+    print("%-26s %5s %10s %9s %6s %10s %9s %6s %7s" % ("Position", "Depth", "Nodes", "Time", "First",
+        feature + " nodes", feature + " time", "First", "Speedup"))
+    for name, moves in BENCH_POSITIONS.items():
+        for depth in range(3, maxDepth + 1):
+            nodes, seconds, rate = searchPosition(moves, depth, switch, False)
+            onNodes, onSeconds, onRate = searchPosition(moves, depth, switch, True)
+            print("%-26s %5d %10d %8.2fs %5.0f%% %10d %8.2fs %5.0f%% %6.2fx" % (name, depth, nodes, seconds, rate * 100,
+                onNodes, onSeconds, onRate * 100, seconds / onSeconds))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,417 @@
+"""
+A bitboard backend for the GameState. The board list is still kept up to date so the rest of the program
+works unchanged, but the legal moves are generated from 12 piece bitboards and precomputed attack tables.
+Square (row, col) is bit row * 8 + col, so bit 0 is a8 and bit 63 is h1.
+"""
+
+from ChessEngine import GameState, Move, WHITE_KINGSIDE, WHITE_QUEENSIDE, BLACK_KINGSIDE, BLACK_QUEENSIDE, SEE_VALUES
+
+FULL = (1 << 64) - 1
+PROMOTION_SQUARES = 0xFF | 0xFF << 56 # The 8th and 1st ranks
+A_FILE = 0x0101010101010101
+B_FILE = 0x0202020202020202
+C7H2_DIAGONAL = 0x0004081020408000 # Maps the inner squares of the A file onto the top six bits
+PIECES = ("wp", "wR", "wN", "wB", "wQ", "wK", "bp", "bR", "bN", "bB", "bQ", "bK")
+ROOK_DIRECTIONS = ((-1, 0), (1, 0), (0, -1), (0, 1))
+BISHOP_DIRECTIONS = ((-1, -1), (-1, 1), (1, -1), (1, 1))
+KNIGHT_JUMPS = ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1))
+KING_STEPS = ((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1))
+SEE_ORDER = ('p', 'N', 'B', 'R', 'Q', 'K') # Least valuable attacker first
+
+"""
+Bitboard of the squares a piece reaches from sq by repeating each step until it leaves the board or hits
+a piece in occupied. Only used to build the lookup tables below.
+"""
+def slidingAttacks(sq, occupied, directions, maxSteps = 7):
+    attacks = 0
+    r, c = divmod(sq, 8)
+    for dr, dc in directions:
+        for i in range(1, maxSteps + 1):
+            endRow, endCol = r + dr * i, c + dc * i
+            if not (0 <= endRow < 8 and 0 <= endCol < 8):
+                break
+            attacks |= 1 << (endRow * 8 + endCol)
+            if occupied >> (endRow * 8 + endCol) & 1:
+                break
+    return attacks
+
+"""
+Every subset of the bits in mask
+"""
+def subsets(mask):
+    subset = 0
+    while True:
+        yield subset
+        subset = (subset - mask) & mask
+        if subset == 0:
+            return
+
+KNIGHT_ATTACKS = [slidingAttacks(sq, 0, KNIGHT_JUMPS, 1) for sq in range(64)]
+KING_ATTACKS = [slidingAttacks(sq, 0, KING_STEPS, 1) for sq in range(64)]
+# Squares attacked by a pawn of each colour standing on sq, white pawns attack towards row 0
+PAWN_ATTACKS = {'w' : [slidingAttacks(sq, 0, ((-1, -1), (-1, 1)), 1) for sq in range(64)],
+                'b' : [slidingAttacks(sq, 0, ((1, -1), (1, 1)), 1) for sq in range(64)]}
+
+"""
+Kindergarten lookups. The occupancy of the line through the square is squeezed into a 6 bit index of its
+inner squares (by a shift for rows and by a multiplication for columns and diagonals) and the attack set
+is read from a table of 64 entries per square.
+"""
+def rowIndex(sq, occupied):
+    return (occupied >> ((sq & 56) + 1)) & 63
+
+def columnIndex(sq, occupied):
+    return ((((occupied >> (sq & 7)) & A_FILE) * C7H2_DIAGONAL) & FULL) >> 58
+
+def diagonalIndex(mask, occupied):
+    return (((occupied & mask) * B_FILE) & FULL) >> 58
+
+DIAGONAL_MASKS = [slidingAttacks(sq, 0, ((-1, -1), (1, 1))) for sq in range(64)]
+ANTI_DIAGONAL_MASKS = [slidingAttacks(sq, 0, ((-1, 1), (1, -1))) for sq in range(64)]
+ROW_ATTACKS = [[0] * 64 for sq in range(64)]
+COLUMN_ATTACKS = [[0] * 64 for sq in range(64)]
+DIAGONAL_ATTACKS = [[0] * 64 for sq in range(64)]
+ANTI_DIAGONAL_ATTACKS = [[0] * 64 for sq in range(64)]
+
+for sq in range(64):
+    # The square itself is part of the row and column index, so include it in the occupancies
+    rowMask = slidingAttacks(sq, 0, ((0, -1), (0, 1))) | 1 << sq
+    columnMask = slidingAttacks(sq, 0, ((-1, 0), (1, 0))) | 1 << sq
+    for occupied in subsets(rowMask):
+        ROW_ATTACKS[sq][rowIndex(sq, occupied)] = slidingAttacks(sq, occupied, ((0, -1), (0, 1)))
+    for occupied in subsets(columnMask):
+        COLUMN_ATTACKS[sq][columnIndex(sq, occupied)] = slidingAttacks(sq, occupied, ((-1, 0), (1, 0)))
+    for occupied in subsets(DIAGONAL_MASKS[sq]):
+        DIAGONAL_ATTACKS[sq][diagonalIndex(DIAGONAL_MASKS[sq], occupied)] = slidingAttacks(sq, occupied, ((-1, -1), (1, 1)))
+    for occupied in subsets(ANTI_DIAGONAL_MASKS[sq]):
+        ANTI_DIAGONAL_ATTACKS[sq][diagonalIndex(ANTI_DIAGONAL_MASKS[sq], occupied)] = slidingAttacks(sq, occupied, ((-1, 1), (1, -1)))
+
+def rookAttacks(sq, occupied):
+    return ROW_ATTACKS[sq][(occupied >> ((sq & 56) + 1)) & 63] | \
+        COLUMN_ATTACKS[sq][((((occupied >> (sq & 7)) & A_FILE) * C7H2_DIAGONAL) & FULL) >> 58]
+
+def bishopAttacks(sq, occupied):
+    return DIAGONAL_ATTACKS[sq][(((occupied & DIAGONAL_MASKS[sq]) * B_FILE) & FULL) >> 58] | \
+        ANTI_DIAGONAL_ATTACKS[sq][(((occupied & ANTI_DIAGONAL_MASKS[sq]) * B_FILE) & FULL) >> 58]
+
+# Squares strictly between two squares on the same row, column or diagonal (0 if they are not aligned)
+BETWEEN = [[0] * 64 for sq in range(64)]
+for sq in range(64):
+    for dr, dc in ROOK_DIRECTIONS + BISHOP_DIRECTIONS:
+        between = 0
+        r, c = divmod(sq, 8)
+        for i in range(1, 8):
+            endRow, endCol = r + dr * i, c + dc * i
+            if not (0 <= endRow < 8 and 0 <= endCol < 8):
+                break
+            BETWEEN[sq][endRow * 8 + endCol] = between
+            between |= 1 << (endRow * 8 + endCol)
+
+"""
+Yields the index of every set bit, lowest first
+"""
+def bitIndices(bitboard):
+    while bitboard:
+        bit = bitboard & -bitboard
+        yield bit.bit_length() - 1
+        bitboard ^= bit
+
+
+class BitboardGameState(GameState):
+    def __init__(self, fen = None):
+        super().__init__(fen)
+        self.setBitboardsFromBoard()
+
+    def resetFromBoard(self):
+        super().resetFromBoard()
+        self.setBitboardsFromBoard()
+
+    """
+    Rebuild the piece bitboards from the board list
+    """
+    def setBitboardsFromBoard(self):
+        self.bitboards = {piece : 0 for piece in PIECES}
+        for r in range(8):
+            for c in range(8):
+                if self.board[r][c] != "--":
+                    self.bitboards[self.board[r][c]] |= 1 << (r * 8 + c)
+        self.occupancy = {'w' : 0, 'b' : 0}
+        for piece in PIECES:
+            self.occupancy[piece[0]] |= self.bitboards[piece]
+
+    """
+    XOR the changes a move makes into the bitboards. Doing it a second time takes them back out,
+    so the same function is used to make and to undo a move.
+    """
+    def toggleMove(self, move):
+        bitboards = self.bitboards
+        occupancy = self.occupancy
+        startBit = 1 << (move.startRow * 8 + move.startCol)
+        endBit = 1 << (move.endRow * 8 + move.endCol)
+        color = move.pieceMoved[0]
+        bitboards[move.pieceMoved] ^= startBit
+        bitboards[color + 'Q' if move.isPawnPromotion else move.pieceMoved] ^= endBit
+        occupancy[color] ^= startBit | endBit
+        if move.pieceCaptured != "--":
+            captureBit = 1 << (move.startRow * 8 + move.endCol) if move.isEnpassantMove else endBit
+            bitboards[move.pieceCaptured] ^= captureBit
+            occupancy[move.pieceCaptured[0]] ^= captureBit
+        if move.isCastleMove:
+            if move.endCol - move.startCol == 2: # Kingside castle
+                rookBits = endBit << 1 | endBit >> 1
+            else: # Queenside castle
+                rookBits = endBit >> 2 | endBit << 1
+            bitboards[color + 'R'] ^= rookBits
+            occupancy[color] ^= rookBits
+
+    def makeMove(self, move):
+        super().makeMove(move)
+        self.toggleMove(move)
+
+    def undoMove(self):
+        if len(self.moveLog) != 0 and self.moveLog[-1] is not None: # A null move left the bitboards alone
+            self.toggleMove(self.moveLog[-1])
+        super().undoMove()
+
+    """
+    Bitboard of the pieces of color that attack sq, given the occupied squares
+    """
+    def attackersOf(self, sq, color, occupied):
+        bitboards = self.bitboards
+        enemyColor = 'b' if color == 'w' else 'w'
+        return (PAWN_ATTACKS[enemyColor][sq] & bitboards[color + 'p']) | \
+            (KNIGHT_ATTACKS[sq] & bitboards[color + 'N']) | \
+            (KING_ATTACKS[sq] & bitboards[color + 'K']) | \
+            (rookAttacks(sq, occupied) & (bitboards[color + 'R'] | bitboards[color + 'Q'])) | \
+            (bishopAttacks(sq, occupied) & (bitboards[color + 'B'] | bitboards[color + 'Q']))
+
+    """
+    The same exchange as GameState.staticExchange, the pieces that have taken are cleared from the occupancy
+    so attackersOf finds the sliders behind them
+    """
+    def staticExchange(self, move):
+        bitboards = self.bitboards
+        sq = move.endRow * 8 + move.endCol
+        occupied = (self.occupancy['w'] | self.occupancy['b']) & ~(1 << (move.startRow * 8 + move.startCol))
+        gains = [SEE_VALUES[move.pieceCaptured[1]] if move.isCapture else 0]
+        pieceOnSquare = SEE_VALUES[move.pieceMoved[1]]
+        if move.isEnpassantMove:
+            occupied &= ~(1 << (move.startRow * 8 + move.endCol))
+        if move.isPawnPromotion:
+            gains[0] += SEE_VALUES['Q'] - SEE_VALUES['p']
+            pieceOnSquare = SEE_VALUES['Q']
+        color = 'b' if move.pieceMoved[0] == 'w' else 'w'
+        while True:
+            attackers = self.attackersOf(sq, color, occupied) & occupied
+            if attackers == 0:
+                break
+            for pieceType in SEE_ORDER:
+                pieces = attackers & bitboards[color + pieceType]
+                if pieces:
+                    break
+            gains.append(pieceOnSquare - gains[-1])
+            pieceOnSquare = SEE_VALUES[pieceType]
+            occupied &= ~(pieces & -pieces)
+            color = 'b' if color == 'w' else 'w'
+        for i in range(len(gains) - 1, 0, -1):
+            gains[i - 1] = -max(-gains[i - 1], gains[i])
+        return gains[0]
+
+    """
+    All moves considering the king is in check, the same moves as GameState.getValidMoves
+    """
+    def getValidMoves(self):
+        return self.generateMoves(False)
+
+    """
+    The search asks for pseudo-legal moves, the bitboard generator finds the legal ones about as cheaply
+    with its pin masks, so isLegal has nothing left to check
+    """
+    def getPseudoLegalMoves(self):
+        return self.generateMoves(False)
+
+    def isLegal(self, move):
+        return True
+
+    """
+    If the side to move has at least one legal move, the same answer as GameState.hasLegalMove, which can't be
+    inherited as it trusts isLegal with the pins. Stops generating at the first stage that finds a move.
+    """
+    def hasLegalMove(self):
+        return len(self.generateMoves(False, True, firstOnly = True)) > 0
+
+    def hasNonPawnMaterial(self):
+        color = 'w' if self.whiteToMove else 'b'
+        bitboards = self.bitboards
+        return (bitboards[color + 'N'] | bitboards[color + 'B'] | bitboards[color + 'R'] | bitboards[color + 'Q']) != 0
+
+    def updateInCheck(self):
+        allyColor, enemyColor = ('w', 'b') if self.whiteToMove else ('b', 'w')
+        kingSq = self.bitboards[allyColor + 'K'].bit_length() - 1
+        self.inCheck = self.attackersOf(kingSq, enemyColor, self.occupancy['w'] | self.occupancy['b']) != 0
+        return self.inCheck
+
+    """
+    The legal moves that capture nothing and don't promote, the same moves as GameState.getQuietMoves when not in check
+    """
+    def getQuietMoves(self):
+        return self.generateMoves(False, quietOnly = True)
+
+    """
+    Captures and queen promotions only, or every evasion when in check, the same moves as GameState.getCaptureMoves
+    """
+    def getCaptureMoves(self):
+        return self.generateMoves(True)
+
+    """
+    The valid moves packed into ints (see Move), generated without building a Move for each of them
+    """
+    def getValidMoveCodes(self):
+        return self.generateMoves(False, True)
+
+    """
+    Legal moves of the side to move. With capturesOnly the quiet moves are left out unless the king is in check,
+    with quietOnly it is the captures and promotions that are left out. With asCodes the moves are packed ints
+    instead of Move objects. With firstOnly it returns as soon as a stage has found a move, for hasLegalMove.
+    """
+    def generateMoves(self, capturesOnly, asCodes = False, quietOnly = False, firstOnly = False):
+        bitboards = self.bitboards
+        board = self.board
+        if asCodes:
+            def newMove(startSq, endSq, flags = 0):
+                if PROMOTION_SQUARES >> endSq & 1 and board[startSq >> 3][startSq & 7][1] == 'p':
+                    flags |= Move.PROMOTION_FLAG
+                return startSq | endSq << 6 | flags
+        else:
+            def newMove(startSq, endSq, flags = 0):
+                return Move(divmod(startSq, 8), divmod(endSq, 8), board, isEnpassantMove = flags == Move.ENPASSANT_FLAG,
+                            isCastleMove = flags == Move.CASTLE_FLAG)
+        allyColor, enemyColor = ('w', 'b') if self.whiteToMove else ('b', 'w')
+        allies = self.occupancy[allyColor]
+        enemies = self.occupancy[enemyColor]
+        occupied = allies | enemies
+        kingSq = bitboards[allyColor + 'K'].bit_length() - 1
+        enemyRooks = bitboards[enemyColor + 'R'] | bitboards[enemyColor + 'Q']
+        enemyBishops = bitboards[enemyColor + 'B'] | bitboards[enemyColor + 'Q']
+        checkers = self.attackersOf(kingSq, enemyColor, occupied)
+        self.inCheck = checkers != 0
+        capturesOnly = capturesOnly and not checkers
+        moves = []
+
+        # King moves, the king is taken off the board so it can't hide behind itself from a slider
+        occupiedWithoutKing = occupied ^ (1 << kingSq)
+        for endSq in bitIndices(KING_ATTACKS[kingSq] & (enemies if capturesOnly else ~occupied if quietOnly else ~allies)):
+            if not self.attackersOf(endSq, enemyColor, occupiedWithoutKing):
+                moves.append(newMove(kingSq, endSq))
+        if firstOnly and moves:
+            return moves
+
+        if checkers & (checkers - 1) == 0: # Not in double check, so other pieces can move
+            # Squares that block or capture a single check, every square when not in check
+            if checkers:
+                targetMask = checkers | BETWEEN[kingSq][checkers.bit_length() - 1]
+            elif capturesOnly:
+                targetMask = enemies
+            else:
+                targetMask = FULL
+            targetMask &= ~(occupied if quietOnly else allies)
+            # Pawn pushes only land on empty squares, when looking for captures the promotions are kept
+            if capturesOnly:
+                pushMask = PROMOTION_SQUARES
+            elif quietOnly:
+                pushMask = targetMask & ~PROMOTION_SQUARES
+            else:
+                pushMask = targetMask
+
+            # Pinned pieces may only move along the line between the king and the pinning piece
+            pinMasks = {}
+            snipers = (rookAttacks(kingSq, enemies) & enemyRooks) | (bishopAttacks(kingSq, enemies) & enemyBishops)
+            for sniperSq in bitIndices(snipers):
+                blockers = BETWEEN[kingSq][sniperSq] & occupied
+                if blockers and blockers & (blockers - 1) == 0 and blockers & allies:
+                    pinMasks[blockers.bit_length() - 1] = BETWEEN[kingSq][sniperSq] | (1 << sniperSq)
+
+            for piece, attackFunction in (('N', None), ('B', bishopAttacks), ('R', rookAttacks), ('Q', None)):
+                for sq in bitIndices(bitboards[allyColor + piece]):
+                    if piece == 'N':
+                        if sq in pinMasks:
+                            continue # A pinned knight can never move
+                        targets = KNIGHT_ATTACKS[sq]
+                    elif piece == 'Q':
+                        targets = rookAttacks(sq, occupied) | bishopAttacks(sq, occupied)
+                    else:
+                        targets = attackFunction(sq, occupied)
+                    targets &= targetMask & pinMasks.get(sq, FULL)
+                    for endSq in bitIndices(targets):
+                        moves.append(newMove(sq, endSq))
+            if firstOnly and moves:
+                return moves
+
+            self.getBitboardPawnMoves(allyColor, enemyColor, kingSq, occupied, targetMask, pushMask, pinMasks, moves, newMove,
+                                      not quietOnly)
+
+            # A king that can castle can also step to the square next to it, castling never has to be tried
+            if not checkers and not capturesOnly and not firstOnly:
+                self.getBitboardCastleMoves(allyColor, enemyColor, kingSq, occupied, moves, newMove)
+
+        if len(moves) == 0 and not capturesOnly and not quietOnly and not firstOnly:
+            if self.inCheck:
+                self.checkmate = True
+            else:
+                self.stalemate = True
+        return moves
+
+    def getBitboardPawnMoves(self, allyColor, enemyColor, kingSq, occupied, targetMask, pushMask, pinMasks, moves, newMove,
+                             enpassant = True):
+        pawns = self.bitboards[allyColor + 'p']
+        empty = ~occupied & FULL
+        enemies = self.occupancy[enemyColor]
+        if allyColor == 'w':
+            step, startRow = -8, 6
+        else:
+            step, startRow = 8, 1
+
+        epSq = -1
+        if enpassant and self.enpassantPossible != ():
+            epSq = self.enpassantPossible[0] * 8 + self.enpassantPossible[1]
+
+        for sq in bitIndices(pawns):
+            pinMask = pinMasks.get(sq, FULL)
+            allowed = targetMask & pinMask
+            pushAllowed = pushMask & pinMask
+            oneStep = sq + step
+            if empty >> oneStep & 1:
+                if pushAllowed >> oneStep & 1:
+                    moves.append(newMove(sq, oneStep))
+                twoStep = oneStep + step
+                if sq >> 3 == startRow and empty >> twoStep & 1 and pushAllowed >> twoStep & 1:
+                    moves.append(newMove(sq, twoStep))
+
+            attacks = PAWN_ATTACKS[allyColor][sq]
+            for endSq in bitIndices(attacks & enemies & allowed):
+                moves.append(newMove(sq, endSq))
+
+            if epSq >= 0 and attacks >> epSq & 1:
+                capturedSq = epSq - step
+                # The capture must resolve a check (by taking the checking pawn or blocking) and respect pins
+                if not ((targetMask >> epSq | targetMask >> capturedSq) & 1) or not pinMask >> epSq & 1:
+                    continue
+                # Both pawns leave the row at once, make sure that doesn't expose the king
+                occupiedAfter = (occupied ^ (1 << sq) ^ (1 << capturedSq)) | (1 << epSq)
+                bitboards = self.bitboards
+                if rookAttacks(kingSq, occupiedAfter) & (bitboards[enemyColor + 'R'] | bitboards[enemyColor + 'Q']) or \
+                        bishopAttacks(kingSq, occupiedAfter) & (bitboards[enemyColor + 'B'] | bitboards[enemyColor + 'Q']):
+                    continue
+                moves.append(newMove(sq, epSq, Move.ENPASSANT_FLAG))
+
+    def getBitboardCastleMoves(self, allyColor, enemyColor, kingSq, occupied, moves, newMove):
+        if allyColor == 'w':
+            kingSide, queenSide = self.castlingRights & WHITE_KINGSIDE, self.castlingRights & WHITE_QUEENSIDE
+        else:
+            kingSide, queenSide = self.castlingRights & BLACK_KINGSIDE, self.castlingRights & BLACK_QUEENSIDE
+        if kingSide and not occupied >> (kingSq + 1) & 3 and \
+                not self.attackersOf(kingSq + 1, enemyColor, occupied) and not self.attackersOf(kingSq + 2, enemyColor, occupied):
+            moves.append(newMove(kingSq, kingSq + 2, Move.CASTLE_FLAG))
+        if queenSide and not occupied >> (kingSq - 3) & 7 and \
+                not self.attackersOf(kingSq - 1, enemyColor, occupied) and not self.attackersOf(kingSq - 2, enemyColor, occupied):
+            moves.append(newMove(kingSq, kingSq - 2, Move.CASTLE_FLAG))
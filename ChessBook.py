@@ -0,0 +1,211 @@
+"""
+Opening book in the Polyglot file layout: sorted 16 byte entries of a 64 bit position key, a 16 bit move,
+a 16 bit weight and a 32 bit learn field, all big-endian. The key is the engine's own Zobrist key
+(GameState.zobristKey) rather than the Polyglot one, so books built by other tools won't match any position.
+The file is memory-mapped and searched with a binary search, so opening it costs nothing and the pages that are
+never probed are never read.
+Build a book with: python ChessBook.py build games.pgn book.bin [--plies N] [--min-games N]
+List the book moves of a position with: python ChessBook.py probe book.bin [--fen FEN]
+"""
+
+import argparse
+import mmap
+import os
+import random
+import re
+import struct
+from ChessEngine import STARTING_FEN, toSan
+from ChessBitboard import BitboardGameState
+
+ENTRY = struct.Struct(">QHHI") # key, move, weight, learn
+KEY = struct.Struct(">Q")
+BOOK_PLIES = 24 # Plies of each game that go into the book
+MIN_GAMES = 1 # A move has to be played in at least this many games to get into the book
+MAX_WEIGHT = 0xFFFF
+RESULT_POINTS = {"1-0" : (2, 0), "0-1" : (0, 2), "1/2-1/2" : (1, 1), "*" : (1, 1)} # (white, black) weight per game
+
+# Reads os.urandom, so the AI processes forked from the same parent don't all pick the same book moves
+bookRandom = random.SystemRandom()
+
+# Books opened by getBookMove, by path
+openBooks = {}
+
+"""
+The move in the Polyglot encoding: the end file and rank in bits 0-5, the start file and rank in bits 6-11
+(rank 0 is the first rank) and the promotion piece in bits 12-14. Castling is written as the king taking its own rook.
+"""
+def bookMoveCode(move):
+    endCol = move.endCol
+    if move.isCastleMove:
+        endCol = 7 if move.endCol == 6 else 0
+    code = endCol | (7 - move.endRow) << 3 | move.startCol << 6 | (7 - move.startRow) << 9
+    if move.isPawnPromotion:
+        code |= 4 << 12 # Always a queen
+    return code
+
+class OpeningBook():
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        size = os.fstat(self.file.fileno()).st_size
+        if size % ENTRY.size != 0:
+            self.file.close()
+            raise ValueError("%s is not an opening book, its size is not a multiple of %d bytes" % (path, ENTRY.size))
+        self.entries = size // ENTRY.size
+        # mmap can't map an empty file
+        self.data = mmap.mmap(self.file.fileno(), 0, access = mmap.ACCESS_READ) if size else b""
+
+    """
+    Index of the first entry whose key is not less than key
+    """
+    def findFirst(self, key):
+        low, high = 0, self.entries
+        while low < high:
+            middle = (low + high) // 2
+            if KEY.unpack_from(self.data, middle * ENTRY.size)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    """
+    The (move code, weight) pairs stored for key
+    """
+    def probe(self, key):
+        entries = []
+        index = self.findFirst(key)
+        while index < self.entries:
+            entryKey, code, weight, learn = ENTRY.unpack_from(self.data, index * ENTRY.size)
+            if entryKey != key:
+                break
+            entries.append((code, weight))
+            index += 1
+        return entries
+
+    """
+    The valid moves of the position that are in the book, as (move, weight) pairs
+    """
+    def getMoves(self, gs, validMoves):
+        weights = dict(self.probe(gs.zobristKey))
+        if not weights:
+            return []
+        return [(move, weights[bookMoveCode(move)]) for move in validMoves if bookMoveCode(move) in weights]
+
+    """
+    A book move picked at random with a probability proportional to its weight, None when the position isn't in the book
+    """
+    def chooseMove(self, gs, validMoves, rng = bookRandom):
+        moves = [(move, weight) for move, weight in self.getMoves(gs, validMoves) if weight > 0]
+        if not moves:
+            return None
+        return rng.choices([move for move, weight in moves], weights = [weight for move, weight in moves])[0]
+
+    def close(self):
+        if self.entries:
+            self.data.close()
+        self.file.close()
+
+"""
+The book move for the position from the book at path, None when there is no book file or the position isn't in it.
+The book is opened once per process.
+"""
+def getBookMove(gs, validMoves, path):
+    if path not in openBooks:
+        openBooks[path] = OpeningBook(path) if os.path.exists(path) else None
+    book = openBooks[path]
+    return None if book is None else book.chooseMove(gs, validMoves)
+
+# A header tag, a comment, a numeric annotation, a variation bracket, a result, a move number or a move
+PGN_TOKEN = re.compile(r'\[\s*(\w+)\s+"([^"]*)"\s*\]|\{[^}]*\}|;[^\n]*|\$\d+|[()]|1-0|0-1|1/2-1/2|\*|\d+\.+|[^\s()\[\]{};]+')
+
+"""
+Yield the games of a PGN text as (result, list of SAN moves), variations and comments are skipped
+"""
+def readPgnGames(text):
+    result, moves, variationDepth = "*", [], 0
+    for match in PGN_TOKEN.finditer(text):
+        token = match.group(0)
+        if match.group(1): # Header tag, a new game starts if the last one had no result token
+            if moves:
+                yield result, moves
+                moves = []
+            if match.group(1) == "Result":
+                result = match.group(2)
+        elif token == "(":
+            variationDepth += 1
+        elif token == ")":
+            variationDepth = max(variationDepth - 1, 0)
+        elif variationDepth or token[0] in "{;$" or token[0].isdigit() and token.endswith("."):
+            continue
+        elif token in RESULT_POINTS:
+            yield (result if result in RESULT_POINTS else token), moves
+            result, moves = "*", []
+        else:
+            moves.append(token)
+    if moves:
+        yield result, moves
+
+"""
+Strip the check, mate and annotation marks from a SAN move
+"""
+def plainSan(san):
+    return san.rstrip("+#!?").replace("0", "O")
+
+"""
+Play through the games of a PGN file and write a book of the moves played in their first plies.
+Each time a move is played it gets 2 points of weight for a win of the side that played it, 1 for a draw and 0 for a loss.
+Returns the number of games read and the number of entries written.
+"""
+def buildBook(pgnPath, bookPath, plies = BOOK_PLIES, minGames = MIN_GAMES):
+    with open(pgnPath, encoding = "utf-8", errors = "replace") as pgnFile:
+        text = pgnFile.read()
+    points = {} # (key, move code) : [games, weight]
+    games = 0
+    for result, sanMoves in readPgnGames(text):
+        games += 1
+        gs = BitboardGameState()
+        for san in sanMoves[:plies]:
+            validMoves = gs.getValidMoves()
+            sanToMove = {plainSan(toSan(gs, move, validMoves)) : move for move in validMoves}
+            move = sanToMove.get(plainSan(san))
+            if move is None: # Illegal or an underpromotion, which the engine doesn't generate
+                break
+            entry = points.setdefault((gs.zobristKey, bookMoveCode(move)), [0, 0])
+            entry[0] += 1
+            entry[1] += RESULT_POINTS.get(result, RESULT_POINTS["*"])[0 if gs.whiteToMove else 1]
+            gs.makeMove(move)
+    entries = sorted((key, code, weight) for (key, code), (count, weight) in points.items() if count >= minGames and weight > 0)
+    scale = min(1.0, MAX_WEIGHT / max([weight for key, code, weight in entries] or [1]))
+    with open(bookPath, "wb") as bookFile:
+        for key, code, weight in entries:
+            bookFile.write(ENTRY.pack(key, code, max(1, int(weight * scale)), 0))
+    return games, len(entries)
+
+def main():
+    parser = argparse.ArgumentParser(description = "Build or probe an opening book")
+    commands = parser.add_subparsers(dest = "command", required = True)
+    build = commands.add_parser("build", help = "build a book from a PGN file")
+    build.add_argument("pgn", help = "PGN file with the games")
+    build.add_argument("book", help = "book file to write")
+    build.add_argument("--plies", type = int, default = BOOK_PLIES, help = "plies of each game to use (default %d)" % BOOK_PLIES)
+    build.add_argument("--min-games", type = int, default = MIN_GAMES, help = "games a move needs to be played in (default %d)" % MIN_GAMES)
+    probe = commands.add_parser("probe", help = "list the book moves of a position")
+    probe.add_argument("book", help = "book file to read")
+    probe.add_argument("--fen", default = STARTING_FEN, help = "position to look up")
+    args = parser.parse_args()
+    if args.command == "build":
+        games, entries = buildBook(args.pgn, args.book, args.plies, args.min_games)
+        print("%d games, %d book entries written to %s" % (games, entries, args.book))
+    else:
+        book = OpeningBook(args.book)
+        gs = BitboardGameState(args.fen)
+        validMoves = gs.getValidMoves()
+        moves = sorted(book.getMoves(gs, validMoves), key = lambda pair: -pair[1])
+        total = sum(weight for move, weight in moves)
+        for move, weight in moves:
+            print("%-8s %6d %5.1f%%" % (toSan(gs, move, validMoves), weight, 100 * weight / max(total, 1)))
+        if not moves:
+            print("Position not in the book")
+        book.close()
+
+if __name__ == "__main__":
+    main()
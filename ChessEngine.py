@@ -3,8 +3,51 @@ This class is responsible for storing all the information about the current stat
 It will also be responsible for determining the valid moves at the current state. It will also keep a move log
 """
 
+import random
+from ChessEvaluation import pieceScores, midgameValues, endgameValues, piecePhases
+from ChessTables import DIRECTIONS, DIRECTION_SLIDERS, RAYS, KNIGHT_SQUARES, KING_SQUARES, PAWN_ATTACKS, \
+    DIRECTION_INDEX, BETWEEN, PIECE_LINES
+
+DEBUG_EVALUATION = False # Check the incremental evaluation against a full recompute after every move
+STARTING_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+
+# The castling rights are kept as one number, a bit for each of these
+WHITE_KINGSIDE = 1
+WHITE_QUEENSIDE = 2
+BLACK_KINGSIDE = 4
+BLACK_QUEENSIDE = 8
+ALL_CASTLING = 15
+# The rights that survive a move from or to each square (square = row * 8 + col): a king or rook leaving its
+# starting square, or a rook being taken there, loses the rights that depend on it
+CASTLE_MASKS = [ALL_CASTLING] * 64
+CASTLE_MASKS[0] = ALL_CASTLING & ~BLACK_QUEENSIDE
+CASTLE_MASKS[4] = ALL_CASTLING & ~(BLACK_KINGSIDE | BLACK_QUEENSIDE)
+CASTLE_MASKS[7] = ALL_CASTLING & ~BLACK_KINGSIDE
+CASTLE_MASKS[56] = ALL_CASTLING & ~WHITE_QUEENSIDE
+CASTLE_MASKS[60] = ALL_CASTLING & ~(WHITE_KINGSIDE | WHITE_QUEENSIDE)
+CASTLE_MASKS[63] = ALL_CASTLING & ~WHITE_KINGSIDE
+
+# Piece values for the static exchange evaluation. The king can only take last, its big value keeps it from
+# taking a defended piece.
+SEE_VALUES = dict(pieceScores, K = 100)
+
+"""
+Random 64 bit numbers used to build the Zobrist key of a position. The key is the XOR of one number per
+piece on its square, one for the side to move, one for the castling rights and one for the en-passant file.
+The generator is seeded so the keys are the same every time the engine runs.
+"""
+zobristRandom = random.Random(20230101)
+zobristPieces = {piece : [[zobristRandom.getrandbits(64) for col in range(8)] for row in range(8)]
+                 for piece in ("wp", "wR", "wN", "wB", "wQ", "wK", "bp", "bR", "bN", "bB", "bQ", "bK")}
+zobristBlackToMove = zobristRandom.getrandbits(64)
+zobristCastling = [zobristRandom.getrandbits(64) for i in range(16)] # Indexed by the castling rights
+zobristEnpassant = [zobristRandom.getrandbits(64) for col in range(8)] # Indexed by the en-passant column
+
 class GameState():
-    def __init__(self):
+    """
+    Starts from the normal starting position, or from the position in Forsyth-Edwards Notation when fen is given
+    """
+    def __init__(self, fen = None):
         # The board is an 8 by 8 2D list and each element of the list has two characters. 
         # The first character represents the color of the piece 'b' or 'w'
         # The second character represents the type of the pice 'p', 'B', 'N', 'R', 'Q', 'K'
@@ -22,7 +65,6 @@ class GameState():
         
         self.moveFunctions = {'p' : self.getPawnMoves, 'R' : self.getRookMoves, 'N' : self.getKnightMoves,
                               'B' : self.getBishopMoves, 'Q': self.getQueenMoves, 'K': self.getKingMoves}
-        
         self.whiteToMove = True
         self.moveLog = []
         self.whiteKingLocation = (7, 4)
@@ -33,18 +75,210 @@ class GameState():
         self.pins = []
         self.checks = []
         self.enpassantPossible = () # Coordinates for the square where en passant capture is possible
-        self.enpassantPossibleLog = [self.enpassantPossible]
-        self.currentCastlingRight = CastleRights(True, True, True, True)
-        self.castleRightsLog = [CastleRights(self.currentCastlingRight.wks, self.currentCastlingRight.bks,
-                                            self.currentCastlingRight.wqs, self.currentCastlingRight.bqs)]
-        
+        self.castlingRights = ALL_CASTLING
+        self.zobristKey = self.computeZobristKey() # Updated incrementally in makeMove, restored in undoMove
+        # Midgame and endgame totals, white minus black, and the game phase, updated in makeMove and restored in undoMove
+        self.midgame, self.endgame, self.phase = self.computeEvaluation()
+        # One tuple per move made: the castling rights, en-passant square, Zobrist key, midgame and endgame totals,
+        # phase and halfmove clock from before it, everything undoMove can't work out from the move itself.
+        # The keys are the hash history repetitionCount looks through.
+        self.undoLog = []
+        self.halfmoveClock = 0 # Half moves since the last capture or pawn move, for the fifty-move rule
+        self.startFullmoveNumber = 1 # Move number of the starting position, for getFen
+        if fen is not None:
+            self.loadFen(fen)
+
+    """
+    Set up the position from a string in Forsyth-Edwards Notation. Raises ValueError if it can't be read.
+    """
+    def loadFen(self, fen):
+        fields = fen.split()
+        rows = fields[0].split("/") if fields else []
+        if len(fields) < 4 or len(rows) != 8:
+            raise ValueError("Invalid FEN: " + fen)
+        board = []
+        for rowText in rows:
+            row = []
+            for char in rowText:
+                if char.isdigit():
+                    row.extend(["--"] * int(char))
+                elif char in "KQRBNPkqrbnp":
+                    row.append(("w" if char.isupper() else "b") + (char.upper() if char.upper() != "P" else "p"))
+                else:
+                    raise ValueError("Invalid FEN: " + fen)
+            if len(row) != 8:
+                raise ValueError("Invalid FEN: " + fen)
+            board.append(row)
+        if sum(row.count("wK") for row in board) != 1 or sum(row.count("bK") for row in board) != 1 or fields[1] not in ("w", "b"):
+            raise ValueError("Invalid FEN: " + fen)
+        if any(piece[1] == "p" for piece in board[0] + board[7]): # A pawn on the first or eighth rank
+            raise ValueError("Invalid FEN: " + fen)
+        self.board = board
+        self.whiteToMove = fields[1] == "w"
+        castling = fields[2]
+        if castling != "-" and (not castling or any(char not in "KQkq" for char in castling)):
+            raise ValueError("Invalid FEN: " + fen)
+        self.castlingRights = ("K" in castling and WHITE_KINGSIDE) | ("Q" in castling and WHITE_QUEENSIDE) | \
+            ("k" in castling and BLACK_KINGSIDE) | ("q" in castling and BLACK_QUEENSIDE)
+        # A right is only kept while its king and rook are still on their starting squares
+        for sq, piece in ((0, "bR"), (4, "bK"), (7, "bR"), (56, "wR"), (60, "wK"), (63, "wR")):
+            if board[sq // 8][sq % 8] != piece:
+                self.castlingRights &= CASTLE_MASKS[sq]
+        enpassant = fields[3]
+        if enpassant == "-":
+            self.enpassantPossible = ()
+        elif len(enpassant) == 2 and enpassant[0] in Move.filesToCols and enpassant[1] == ("6" if self.whiteToMove else "3"):
+            # The square a pawn just passed moving two squares: the pawn in front of it, it and the start square empty
+            r, c = Move.ranksToRows[enpassant[1]], Move.filesToCols[enpassant[0]]
+            direction = 1 if self.whiteToMove else -1
+            if board[r + direction][c] != ("b" if self.whiteToMove else "w") + "p" or board[r][c] != "--" or \
+                    board[r - direction][c] != "--":
+                raise ValueError("Invalid FEN: " + fen)
+            self.enpassantPossible = (r, c)
+        else:
+            raise ValueError("Invalid FEN: " + fen)
+        if not all(field.isdigit() for field in fields[4:6]):
+            raise ValueError("Invalid FEN: " + fen)
+        self.startFullmoveNumber = int(fields[5]) if len(fields) > 5 else 1
+        self.resetFromBoard()
+        self.halfmoveClock = int(fields[4]) if len(fields) > 4 else 0
+
+    """
+    The current position in Forsyth-Edwards Notation
+    """
+    def getFen(self):
+        rows = []
+        for row in self.board:
+            rowText = ""
+            empty = 0
+            for piece in row:
+                if piece == "--":
+                    empty += 1
+                    continue
+                if empty:
+                    rowText += str(empty)
+                    empty = 0
+                rowText += piece[1].upper() if piece[0] == "w" else piece[1].lower()
+            rows.append(rowText + (str(empty) if empty else ""))
+        castling = "".join(letter for letter, right in (("K", WHITE_KINGSIDE), ("Q", WHITE_QUEENSIDE), ("k", BLACK_KINGSIDE),
+                                                        ("q", BLACK_QUEENSIDE)) if self.castlingRights & right)
+        enpassant = "-"
+        if self.enpassantPossible != ():
+            enpassant = Move.colsToFiles[self.enpassantPossible[1]] + Move.rowsToRanks[self.enpassantPossible[0]]
+        startedWithBlack = len(self.moveLog) % 2 == (1 if self.whiteToMove else 0)
+        fullmoveNumber = self.startFullmoveNumber + (len(self.moveLog) + startedWithBlack) // 2
+        return " ".join(("/".join(rows), "w" if self.whiteToMove else "b", castling or "-", enpassant,
+                         str(self.halfmoveClock), str(fullmoveNumber)))
+
+    """
+    Make the position on the board the start of the game: find the kings, forget the move history and
+    rebuild the Zobrist key and the evaluation. Used after the board, side to move, castling rights and
+    en-passant square were set directly.
+    """
+    def resetFromBoard(self):
+        for r in range(8):
+            for c in range(8):
+                if self.board[r][c] == "wK":
+                    self.whiteKingLocation = (r, c)
+                elif self.board[r][c] == "bK":
+                    self.blackKingLocation = (r, c)
+        self.moveLog = []
+        self.undoLog = []
+        self.halfmoveClock = 0
+        self.checkmate = self.stalemate = False
+        self.zobristKey = self.computeZobristKey()
+        self.midgame, self.endgame, self.phase = self.computeEvaluation()
+
+    """
+    The position as a short string, enough to search it in another process: one character per square
+    (FEN letters, '.' for empty), the side to move, the castling rights index in hex and the en-passant column
+    """
+    def serialize(self):
+        squares = "".join(piece[1].upper() if piece[0] == 'w' else piece[1].lower() if piece[0] == 'b' else "."
+                          for row in self.board for piece in row)
+        enpassant = str(self.enpassantPossible[1]) if self.enpassantPossible != () else "-"
+        return squares + ("w" if self.whiteToMove else "b") + "%x" % self.castlingRights + enpassant
+
+    """
+    New game state (of the class it is called on) set up from a string made by serialize
+    """
+    @classmethod
+    def deserialize(cls, data):
+        gs = cls()
+        for i, char in enumerate(data[:64]):
+            if char == ".":
+                gs.board[i // 8][i % 8] = "--"
+            else:
+                gs.board[i // 8][i % 8] = ("w" if char.isupper() else "b") + (char.upper() if char.upper() != "P" else "p")
+        gs.whiteToMove = data[64] == "w"
+        gs.castlingRights = int(data[65], 16)
+        if data[66] == "-":
+            gs.enpassantPossible = ()
+        else:
+            gs.enpassantPossible = (2 if gs.whiteToMove else 5, int(data[66]))
+        gs.resetFromBoard()
+        return gs
+
+    """
+    Compute the Zobrist key of the current position from scratch
+    """
+    def computeZobristKey(self):
+        key = 0
+        for r in range(8):
+            for c in range(8):
+                piece = self.board[r][c]
+                if piece != "--":
+                    key ^= zobristPieces[piece][r][c]
+        if not self.whiteToMove:
+            key ^= zobristBlackToMove
+        key ^= zobristCastling[self.castlingRights]
+        if self.enpassantPossible != ():
+            key ^= zobristEnpassant[self.enpassantPossible[1]]
+        return key
+
+    """
+    Compute the midgame and endgame totals and the phase of the current position from scratch
+    """
+    def computeEvaluation(self):
+        midgame = 0
+        endgame = 0
+        phase = 0
+        for r in range(8):
+            for c in range(8):
+                piece = self.board[r][c]
+                if piece != "--":
+                    midgame += midgameValues[piece][r * 8 + c]
+                    endgame += endgameValues[piece][r * 8 + c]
+                    phase += piecePhases[piece]
+        return midgame, endgame, phase
+
     def makeMove(self, move):
+        self.undoLog.append((self.castlingRights, self.enpassantPossible, self.zobristKey, self.midgame, self.endgame, self.phase,
+                             self.halfmoveClock))
+        key = self.zobristKey
+        key ^= zobristPieces[move.pieceMoved][move.startRow][move.startCol]
+        startSq = move.moveID & 63
+        endSq = move.moveID >> 6
+        midgame = self.midgame - midgameValues[move.pieceMoved][startSq]
+        endgame = self.endgame - endgameValues[move.pieceMoved][startSq]
+        phase = self.phase
+        if move.pieceCaptured != "--":
+            phase -= piecePhases[move.pieceCaptured]
+            if move.isEnpassantMove:
+                capturedSq = move.startRow * 8 + move.endCol
+            else:
+                capturedSq = endSq
+                key ^= zobristPieces[move.pieceCaptured][move.endRow][move.endCol]
+            midgame -= midgameValues[move.pieceCaptured][capturedSq]
+            endgame -= endgameValues[move.pieceCaptured][capturedSq]
 
         # Make the move regardless of what it is
         self.board[move.startRow][move.startCol] = "--"
         self.board[move.endRow][move.endCol] = move.pieceMoved
         self.moveLog.append(move) # Log the move so we can undo it or review the game later.
         self.whiteToMove = not self.whiteToMove # Swap Players
+        # A capture or pawn move can't be undone, the positions before it never come back
+        self.halfmoveClock = 0 if move.pieceCaptured != "--" or move.pieceMoved[1] == 'p' else self.halfmoveClock + 1
 
         # Update the king's location:
         if move.pieceMoved == 'wK':
@@ -57,37 +291,67 @@ class GameState():
             # choice = input("Promote to Queen (Q), Bishop (B), Rook (R), Knight (N)")
             # self.board[move.endRow][move.endCol] = move.pieceMoved[0] + choice.upper()
             self.board[move.endRow][move.endCol] = move.pieceMoved[0] + 'Q'
+            phase += piecePhases[move.pieceMoved[0] + 'Q']
+        piece = self.board[move.endRow][move.endCol]
+        key ^= zobristPieces[piece][move.endRow][move.endCol]
+        midgame += midgameValues[piece][endSq]
+        endgame += endgameValues[piece][endSq]
 
         # Check to see if it's an En-Passant
         if move.isEnpassantMove:
             self.board[move.startRow][move.endCol] = "--" # Capturing the pawn
+            key ^= zobristPieces[move.pieceCaptured][move.startRow][move.endCol]
 
         # Update enpassantPossible variable
+        if self.enpassantPossible != ():
+            key ^= zobristEnpassant[self.enpassantPossible[1]]
         if move.pieceMoved[1] == 'p' and abs(move.startRow - move.endRow) == 2: # Only on 2 square pawn advances
             self.enpassantPossible = ((move.startRow + move.endRow)//2, move.endCol)
-            self.enpassantPossibleLog.append(self.enpassantPossible)
+            key ^= zobristEnpassant[move.endCol]
         else:
             self.enpassantPossible = ()
-        
+
         # Castling move
         if move.isCastleMove:
             if move.endCol - move.startCol == 2: # Kingside castle
-                self.board[move.endRow][move.endCol - 1] = self.board[move.endRow][move.endCol + 1] # Move the rook to the new square
+                rook = self.board[move.endRow][move.endCol + 1]
+                self.board[move.endRow][move.endCol - 1] = rook # Move the rook to the new square
                 self.board[move.endRow][move.endCol + 1] = "--" # Remove the rook from the old square
+                key ^= zobristPieces[rook][move.endRow][move.endCol + 1] ^ zobristPieces[rook][move.endRow][move.endCol - 1]
+                midgame += midgameValues[rook][endSq - 1] - midgameValues[rook][endSq + 1]
+                endgame += endgameValues[rook][endSq - 1] - endgameValues[rook][endSq + 1]
 
             else: # Queenside castle
-                self.board[move.endRow][move.endCol + 1] = self.board[move.endRow][move.endCol - 2]
+                rook = self.board[move.endRow][move.endCol - 2]
+                self.board[move.endRow][move.endCol + 1] = rook
                 self.board[move.endRow][move.endCol - 2] = "--"
+                key ^= zobristPieces[rook][move.endRow][move.endCol - 2] ^ zobristPieces[rook][move.endRow][move.endCol + 1]
+                midgame += midgameValues[rook][endSq + 1] - midgameValues[rook][endSq - 2]
+                endgame += endgameValues[rook][endSq + 1] - endgameValues[rook][endSq - 2]
 
-        # Update castling rights - whenever a rook or a king moves
-        self.updateCastleRights(move)
-        self.castleRightsLog.append(CastleRights(self.currentCastlingRight.wks, self.currentCastlingRight.bks,
-                                            self.currentCastlingRight.wqs, self.currentCastlingRight.bqs))
+        # Update castling rights - whenever a rook or a king moves, or a rook is taken
+        rights = self.castlingRights
+        newRights = rights & CASTLE_MASKS[move.startRow * 8 + move.startCol] & CASTLE_MASKS[move.endRow * 8 + move.endCol]
+        if newRights != rights:
+            key ^= zobristCastling[rights] ^ zobristCastling[newRights]
+            self.castlingRights = newRights
+
+        self.zobristKey = key ^ zobristBlackToMove
+        self.midgame = midgame
+        self.endgame = endgame
+        self.phase = phase
+        if DEBUG_EVALUATION:
+            assert (midgame, endgame, phase) == self.computeEvaluation(), "Incremental evaluation is out of step after " + str(move)
 
 
     def undoMove(self):
         if len(self.moveLog) != 0: # Make sure the moveLog isn't empty
             move = self.moveLog.pop()
+            if move is None: # A null move only passed the turn
+                self.whiteToMove = not self.whiteToMove
+                self.castlingRights, self.enpassantPossible, self.zobristKey, self.midgame, self.endgame, self.phase, \
+                    self.halfmoveClock = self.undoLog.pop()
+                return
             self.board[move.startRow][move.startCol] = move.pieceMoved
             self.board[move.endRow][move.endCol] = move.pieceCaptured
             self.whiteToMove = not self.whiteToMove # Switch back turns
@@ -100,14 +364,9 @@ class GameState():
             if move.isEnpassantMove:
                 self.board[move.endRow][move.endCol] = "--" # Leave landing square blank
                 self.board[move.startRow][move.endCol] = move.pieceCaptured
-            if len(self.enpassantPossibleLog) > 0:
-                self.enpassantPossible = self.enpassantPossibleLog.pop()
-                #self.enpassantPossible = self.enpassantPossibleLog[-1]
-
-            # Undo castling rights
-            self.castleRightsLog.pop() # Get rid of the new castle rights from the move we are undoing
-            newRights = self.castleRightsLog[-1] # Set the current castle rights to the last one in the list
-            self.currentCastlingRight = CastleRights(newRights.wks, newRights.bks, newRights.wqs, newRights.bqs)
+            # Undo the castling rights, en-passant square, Zobrist key and evaluation
+            self.castlingRights, self.enpassantPossible, self.zobristKey, self.midgame, self.endgame, self.phase, \
+                self.halfmoveClock = self.undoLog.pop()
             # Undo castle move
             if move.isCastleMove:
                 if move.endCol - move.startCol == 2:
@@ -119,133 +378,319 @@ class GameState():
 
             self.checkmate = False
             self.stalemate = False
+            if DEBUG_EVALUATION:
+                assert (self.midgame, self.endgame, self.phase) == self.computeEvaluation(), "Incremental evaluation is out of step after undoing " + str(move)
 
 
     """
-    Updates castle rights after a given move
-    """
-    def updateCastleRights(self, move):
-        if move.pieceMoved == "wK":
-            self.currentCastlingRight.wks = False
-            self.currentCastlingRight.wqs = False
-        elif move.pieceMoved == "bK":
-            self.currentCastlingRight.bks = False
-            self.currentCastlingRight.bqs = False
-        elif move.pieceMoved == "wR":
-            if move.startRow == 7:
-                if move.startCol == 0: # Left rook
-                    self.currentCastlingRight.wqs = False
-                elif move.startCol == 7: # Right rook
-                    self.currentCastlingRight.wks = False
-
-        elif move.pieceMoved == "bR":
-            if move.startRow == 0:
-                if move.startCol == 0: # Left rook
-                    self.currentCastlingRight.bqs = False
-                elif move.startCol == 7: # Right rook
-                    self.currentCastlingRight.bks = False
-
-        # If a rook is captured
-        if move.pieceCaptured == "wR":
-            if move.endRow == 7:
-                if move.endCol == 0:
-                    self.currentCastlingRight.wqs = False
-                else: 
-                    self.currentCastlingRight.wks = False
-
-        elif move.pieceCaptured == "bR":
-            if move.endRow == 0:
-                if move.endCol == 0:
-                    self.currentCastlingRight.bqs = False
-                else:
-                    self.currentCastlingRight.bks = False
+    Pass the turn without moving a piece, for the null move pruning of the search. It is logged as None in
+    moveLog and taken back with undoMove like any other move. It resets the halfmove clock, so a repetition
+    is never found across it.
+    """
+    def makeNullMove(self):
+        self.undoLog.append((self.castlingRights, self.enpassantPossible, self.zobristKey, self.midgame, self.endgame, self.phase,
+                             self.halfmoveClock))
+        self.halfmoveClock = 0
+        key = self.zobristKey ^ zobristBlackToMove
+        if self.enpassantPossible != ():
+            key ^= zobristEnpassant[self.enpassantPossible[1]]
+            self.enpassantPossible = ()
+        self.zobristKey = key
+        self.whiteToMove = not self.whiteToMove
+        self.moveLog.append(None)
 
+    """
+    How many times the current position was on the board before. Only the positions since the last capture
+    or pawn move are looked at, every second one, as the others have the other side to move.
+    """
+    def repetitionCount(self):
+        undoLog = self.undoLog
+        key = self.zobristKey
+        count = 0
+        # undoLog[i] holds the key from before move i
+        for i in range(len(undoLog) - 2, max(len(undoLog) - self.halfmoveClock, 0) - 1, -2):
+            if undoLog[i][2] == key:
+                count += 1
+        return count
+
+    """
+    If the side to move has a piece besides its king and pawns. Without one zugzwang is common, so passing
+    the turn says little about how good the position is.
+    """
+    def hasNonPawnMaterial(self):
+        color = "w" if self.whiteToMove else "b"
+        for row in self.board:
+            for piece in row:
+                if piece[0] == color and piece[1] in "NBRQ":
+                    return True
+        return False
 
     """
     All moves considering the king is in check
     """
     def getValidMoves(self):
-        tempCastleRight = CastleRights(self.currentCastlingRight.wks, self.currentCastlingRight.bks,
-                                    self.currentCastlingRight.wqs, self.currentCastlingRight.bqs)
-
-        tempEnpassantPossible = self.enpassantPossible
-        moves = []
-        self.inCheck, self.pins, self.checks = self.checkForPinsAndChecks()
-        if self.whiteToMove:
-            kingRow = self.whiteKingLocation[0]
-            kingCol = self.whiteKingLocation[1]
-        else:
-            kingRow = self.blackKingLocation[0]
-            kingCol = self.blackKingLocation[1]
-
-        if self.inCheck:
-            if len(self.checks) == 1: # Only 1 check, block check or move king
-                moves = self.getAllPossibleMoves()
-                # To block a check you must move a piece into one of the squares between the enemy piece and the king
-                check = self.checks[0] # Check information
-                checkRow = check[0]
-                checkCol = check[1]
-                pieceChecking = self.board[checkRow][checkCol] # Enemy piece causing the check
-                validSquares = [] # Squares that pieces can move to
-                # If knight, must capture knight or move king, other pieces can be blocked
-                if pieceChecking[1] == 'N':
-                    validSquares = [(checkRow, checkCol)]
-                else:
-                    for i in range(1, 8):
-                        validSquare = (kingRow + check[2] * i, kingCol + check[3] * i) # Check[2] and check[3] are the check directions
-                        validSquares.append(validSquare)
-                        if validSquare[0] == checkRow and validSquare[1] == checkCol: # Once you get to piece and checks
-                            break
-
-                # Get rid of any moves that don't block check or move king
-                for i in range(len(moves) - 1, -1, -1): # Go the the list backwards when removing items
-                    if moves[i].pieceMoved[1] != 'K': # Move doesn't move king so it must block or capture
-                        if not (moves[i].endRow, moves[i].endCol) in validSquares: # Move doesn't block check or capture piece
-                            moves.remove(moves[i])
+        moves = self.getPseudoLegalMoves()
+        if not self.inCheck: # The evasions are legal already
+            moves = [move for move in moves if self.isLegal(move)]
+        if len(moves) == 0: # Checked after the castle moves, a king that can only castle isn't stalemated
+            if self.inCheck:
+                self.checkmate = True
+            else:
+                self.stalemate = True
+        return moves
 
-                if len(moves) == 0:
-                    self.checkmate = True
+    """
+    Moves that follow the rules of the pieces but may leave the king in check, isLegal tells them apart.
+    King moves and castling are only generated when they are safe. Sets inCheck for isLegal.
+    When in check only the legal evasions are generated.
+    """
+    def getPseudoLegalMoves(self):
+        if self.updateInCheck():
+            self.inCheck, self.pins, self.checks = self.checkForPinsAndChecks()
+            return self.getEvasionMoves()
+        self.pins = [] # Without pins the piece functions don't restrict any moves
+        moves = self.getAllPossibleMoves()
+        kingRow, kingCol = self.whiteKingLocation if self.whiteToMove else self.blackKingLocation
+        self.getCastleMoves(kingRow, kingCol, moves)
+        return moves
 
-                if len(moves) == 0 and not self.inCheck:
-                    self.stalemate = True
-                    self.checkmate = False
-                        
-            else: # Double check, king has to move
-                self.getKingMoves(kingRow, kingCol, moves)
+    """
+    Set inCheck to whether the king of the side to move is attacked, and return it
+    """
+    def updateInCheck(self):
+        kingRow, kingCol = self.whiteKingLocation if self.whiteToMove else self.blackKingLocation
+        self.inCheck = self.squareUnderAttack(kingRow, kingCol)
+        return self.inCheck
 
-                if len(moves) == 0:
-                    self.checkmate = True
+    """
+    The Move with moveID in this position, or None when the start square doesn't hold a piece of the side
+    to move. The transposition table keeps its best moves as moveIDs, this turns them back into moves.
+    """
+    def getMoveFromID(self, moveID):
+        startRow, startCol = divmod(moveID & 63, 8)
+        endRow, endCol = divmod(moveID >> 6, 8)
+        piece = self.board[startRow][startCol]
+        if piece[0] != ("w" if self.whiteToMove else "b") or self.board[endRow][endCol][0] == piece[0]:
+            return None
+        isEnpassantMove = piece[1] == 'p' and startCol != endCol and self.board[endRow][endCol] == "--"
+        isCastleMove = piece[1] == 'K' and abs(endCol - startCol) == 2
+        return Move((startRow, startCol), (endRow, endCol), self.board, isEnpassantMove = isEnpassantMove,
+                    isCastleMove = isCastleMove)
 
-                if len(moves) == 0 and not self.inCheck:
-                    self.stalemate = True
-                    self.checkmate = False
-            
-        else: # Not in check so all moves are fine
-            moves = self.getAllPossibleMoves()
-            if len(moves) == 0:
-                self.stalemate = True
+    """
+    If a move from getPseudoLegalMoves doesn't leave the king in check. inCheck has to be the one set when
+    the move was generated. A piece that isn't on a line from the king can't be pinned, when not in check
+    its moves are legal without looking any further.
+    """
+    def isLegal(self, move):
+        if move.pieceMoved[1] == 'K':
+            return True
+        kingRow, kingCol = self.whiteKingLocation if self.whiteToMove else self.blackKingLocation
+        if not self.inCheck and not move.isEnpassantMove:
+            direction = DIRECTION_INDEX[kingRow * 8 + kingCol][move.startRow * 8 + move.startCol]
+            return direction < 0 or not self.isPinned(move, RAYS[kingRow * 8 + kingCol][direction], DIRECTION_SLIDERS[direction])
+        # Try the move on the board and look for attacks on the king
+        board = self.board
+        endPiece = board[move.endRow][move.endCol]
+        board[move.startRow][move.startCol] = "--"
+        board[move.endRow][move.endCol] = move.pieceMoved
+        if move.isEnpassantMove:
+            board[move.startRow][move.endCol] = "--"
+        legal = not self.squareUnderAttack(kingRow, kingCol)
+        board[move.startRow][move.startCol] = move.pieceMoved
+        board[move.endRow][move.endCol] = endPiece
+        if move.isEnpassantMove:
+            board[move.startRow][move.endCol] = move.pieceCaptured
+        return legal
 
-            if self.whiteToMove:
-                self.getCastleMoves(self.whiteKingLocation[0], self.whiteKingLocation[1], moves)
-            else:
-                self.getCastleMoves(self.blackKingLocation[0], self.blackKingLocation[1], moves)
+    """
+    If the piece moved by move is pinned to the king by one of sliders, ray being the squares from the king
+    through the piece, and the move leaves the line of the pin
+    """
+    def isPinned(self, move, ray, sliders):
+        board = self.board
+        enemyColor = "b" if self.whiteToMove else "w"
+        passedPiece = False
+        for endRow, endCol in ray:
+            if endRow == move.endRow and endCol == move.endCol:
+                return False # The piece stays on the line, between the king and the pinning piece or taking it
+            if endRow == move.startRow and endCol == move.startCol:
+                passedPiece = True
+            elif board[endRow][endCol] != "--":
+                if not passedPiece:
+                    return False # Another piece shields the king
+                return board[endRow][endCol][0] == enemyColor and board[endRow][endCol][1] in sliders
+        return False
 
-        self.enpassantPossible = tempEnpassantPossible
-        self.currentCastlingRight = tempCastleRight
-        return moves        
+    """
+    If the side to move has at least one legal move, stopping at the first one that is found.
+    Sets inCheck like getPseudoLegalMoves.
+    """
+    def hasLegalMove(self):
+        if self.updateInCheck():
+            self.inCheck, self.pins, self.checks = self.checkForPinsAndChecks()
+            return len(self.getEvasionMoves()) > 0
+        self.pins = []
+        allyColor = "w" if self.whiteToMove else "b"
+        # A king that can castle can also step to the square next to it, castling never has to be tried
+        for r in range(8):
+            for c in range(8):
+                piece = self.board[r][c]
+                if piece[0] == allyColor:
+                    moves = []
+                    self.moveFunctions[piece[1]](r, c, moves)
+                    for move in moves:
+                        if self.isLegal(move):
+                            return True
+        return False
 
     """
-    Determine if they enemy can attack the square r, c
+    Determine if they enemy can attack the square r, c. Looks outward from the square for knights, pawns,
+    the king and the first piece along every line instead of generating the enemy moves.
     """
     def squareUnderAttack(self, r, c):
-        self.whiteToMove = not self.whiteToMove # Switch to opponent's turn
-        oppMoves = self.getAllPossibleMoves() # Generate the opponent's moves
-        self.whiteToMove = not self.whiteToMove # Switch the turns back
-        for move in oppMoves:
-            if move.endRow == r and move.endCol == c: # Sqaure is under attack
+        board = self.board
+        sq = r * 8 + c
+        if self.whiteToMove:
+            enemyColor, enemyKnight, enemyPawn, allyColor = "b", "bN", "bp", "w"
+            enemyKingRow, enemyKingCol = self.blackKingLocation
+        else:
+            enemyColor, enemyKnight, enemyPawn, allyColor = "w", "wN", "wp", "b"
+            enemyKingRow, enemyKingCol = self.whiteKingLocation
+        if abs(enemyKingRow - r) <= 1 and abs(enemyKingCol - c) <= 1:
+            return True
+        for endRow, endCol in KNIGHT_SQUARES[sq]:
+            if board[endRow][endCol] == enemyKnight:
+                return True
+        # Pawns only attack diagonally, whether or not there is a piece to capture
+        for endRow, endCol in PAWN_ATTACKS[allyColor][sq]:
+            if board[endRow][endCol] == enemyPawn:
                 return True
+        # Rooks and queens along the rows and columns, bishops and queens along the diagonals
+        for ray, sliders in zip(RAYS[sq], DIRECTION_SLIDERS):
+            for endRow, endCol in ray:
+                piece = board[endRow][endCol]
+                if piece != "--":
+                    if piece[0] == enemyColor and piece[1] in sliders:
+                        return True
+                    break
         return False
 
+    """
+    The legal moves when in check, self.pins and self.checks have to be set by checkForPinsAndChecks.
+    Besides the king moves only moves onto the checking piece or the squares between it and the king are
+    generated, by looking outward from those squares for the pieces that reach them. Against a double check
+    only the king can move, and a pinned piece can never stop a check.
+    """
+    def getEvasionMoves(self):
+        board = self.board
+        moves = []
+        kingRow, kingCol = self.whiteKingLocation if self.whiteToMove else self.blackKingLocation
+        self.getKingMoves(kingRow, kingCol, moves)
+        if len(self.checks) != 1:
+            return moves
+        if self.whiteToMove:
+            allyColor, allyPawn, allyKnight, direction = "w", "wp", "wN", -1
+        else:
+            allyColor, allyPawn, allyKnight, direction = "b", "bp", "bN", 1
+        pinned = {(pin[0], pin[1]) for pin in self.pins}
+        checkRow, checkCol = self.checks[0][0], self.checks[0][1]
+        checkSq = checkRow * 8 + checkCol
+        for endRow, endCol in BETWEEN[kingRow * 8 + kingCol][checkSq] + ((checkRow, checkCol),):
+            endSq = endRow * 8 + endCol
+            for startRow, startCol in KNIGHT_SQUARES[endSq]:
+                if board[startRow][startCol] == allyKnight and (startRow, startCol) not in pinned:
+                    moves.append(Move((startRow, startCol), (endRow, endCol), board))
+            for ray, sliders in zip(RAYS[endSq], DIRECTION_SLIDERS):
+                for startRow, startCol in ray:
+                    piece = board[startRow][startCol]
+                    if piece != "--":
+                        if piece[0] == allyColor and piece[1] in sliders and (startRow, startCol) not in pinned:
+                            moves.append(Move((startRow, startCol), (endRow, endCol), board))
+                        break
+            if endSq == checkSq: # Pawns capture the checking piece diagonally
+                for startRow, startCol in PAWN_ATTACKS["b" if self.whiteToMove else "w"][endSq]:
+                    if board[startRow][startCol] == allyPawn and (startRow, startCol) not in pinned:
+                        moves.append(Move((startRow, startCol), (endRow, endCol), board))
+            elif 0 <= endRow - direction < 8: # and block by moving straight ahead one or two squares
+                startRow = endRow - direction
+                if board[startRow][endCol] == allyPawn and (startRow, endCol) not in pinned:
+                    moves.append(Move((startRow, endCol), (endRow, endCol), board))
+                elif board[startRow][endCol] == "--" and startRow == (5 if self.whiteToMove else 2) and \
+                        board[startRow - direction][endCol] == allyPawn and (startRow - direction, endCol) not in pinned:
+                    moves.append(Move((startRow - direction, endCol), (endRow, endCol), board))
+        # En-passant can take a checking pawn or block on the square it passed, isLegal tries it on the board
+        if self.enpassantPossible:
+            endRow, endCol = self.enpassantPossible
+            for startCol in (endCol - 1, endCol + 1):
+                if 0 <= startCol < 8 and board[endRow - direction][startCol] == allyPawn:
+                    move = Move((endRow - direction, startCol), (endRow, endCol), board, isEnpassantMove = True)
+                    if self.isLegal(move):
+                        moves.append(move)
+        return moves
+
+    """
+    Static exchange evaluation: the material the side to move wins with move, a capture or promotion, if both
+    sides keep taking on its end square with their least valuable attacker for as long as it pays. A piece that
+    moves off a line uncovers the attackers behind it. Pins are not looked at.
+    """
+    def staticExchange(self, move):
+        endRow, endCol = move.endRow, move.endCol
+        removed = {(move.startRow, move.startCol)} # Squares whose piece has already taken on the end square
+        gains = [SEE_VALUES[move.pieceCaptured[1]] if move.isCapture else 0]
+        pieceOnSquare = SEE_VALUES[move.pieceMoved[1]]
+        if move.isEnpassantMove:
+            removed.add((move.startRow, endCol))
+        if move.isPawnPromotion:
+            gains[0] += SEE_VALUES['Q'] - SEE_VALUES['p']
+            pieceOnSquare = SEE_VALUES['Q']
+        color = "b" if move.pieceMoved[0] == "w" else "w"
+        while True:
+            attacker = self.leastValuableAttacker(endRow, endCol, color, removed)
+            if attacker is None:
+                break
+            value, square = attacker
+            gains.append(pieceOnSquare - gains[-1]) # What the side taking now is up if its piece is taken back
+            pieceOnSquare = value
+            removed.add(square)
+            color = "b" if color == "w" else "w"
+        # Either side can stop taking when it's ahead, work back from the last capture
+        for i in range(len(gains) - 1, 0, -1):
+            gains[i - 1] = -max(-gains[i - 1], gains[i])
+        return gains[0]
+
+    """
+    The value and square of the cheapest piece of color that attacks r, c, looking through the pieces on the
+    squares in removed. None if there is none.
+    """
+    def leastValuableAttacker(self, r, c, color, removed):
+        board = self.board
+        sq = r * 8 + c
+        # The pawns of color that attack the square stand where a pawn of the other colour on it would attack
+        pawn = color + "p"
+        for endRow, endCol in PAWN_ATTACKS["b" if color == "w" else "w"][sq]:
+            if board[endRow][endCol] == pawn and (endRow, endCol) not in removed:
+                return SEE_VALUES['p'], (endRow, endCol)
+        knight = color + "N"
+        for endRow, endCol in KNIGHT_SQUARES[sq]:
+            if board[endRow][endCol] == knight and (endRow, endCol) not in removed:
+                return SEE_VALUES['N'], (endRow, endCol)
+        best = None
+        for ray, sliders in zip(RAYS[sq], DIRECTION_SLIDERS):
+            for endRow, endCol in ray:
+                piece = board[endRow][endCol]
+                if piece != "--" and (endRow, endCol) not in removed:
+                    if piece[0] == color and piece[1] in sliders and (best is None or SEE_VALUES[piece[1]] < best[0]):
+                        best = SEE_VALUES[piece[1]], (endRow, endCol)
+                    break
+        if best is not None:
+            return best
+        king = color + "K"
+        for endRow, endCol in KING_SQUARES[sq]:
+            if board[endRow][endCol] == king and (endRow, endCol) not in removed:
+                return SEE_VALUES['K'], (endRow, endCol)
+        return None
+
     """
     All moves without the check
     """
@@ -260,6 +705,110 @@ class GameState():
 
         return moves
 
+    """
+    The valid moves packed into ints, see Move.encode
+    """
+    def getValidMoveCodes(self):
+        return [move.encode() for move in self.getValidMoves()]
+
+    """
+    Captures and queen promotions only, for the quiescence search, so the quiet moves are never built.
+    When in check every evasion is returned instead, a position in check isn't quiet.
+    """
+    def getCaptureMoves(self):
+        self.inCheck, self.pins, self.checks = self.checkForPinsAndChecks()
+        if self.inCheck:
+            return self.getEvasionMoves()
+        allyColor = "w" if self.whiteToMove else "b"
+        pinDirections = {(pin[0], pin[1]) : (pin[2], pin[3]) for pin in self.pins}
+        moves = []
+        for r in range(8):
+            for c in range(8):
+                piece = self.board[r][c]
+                if piece[0] != allyColor:
+                    continue
+                pinDirection = pinDirections.get((r, c))
+                if piece[1] == 'p':
+                    self.getPawnCaptures(r, c, pinDirection, moves)
+                    continue
+                for d, line in PIECE_LINES[piece[1]][r * 8 + c]:
+                    # A pinned piece can only move along the pin, a pinned knight never matches it
+                    if pinDirection is not None and pinDirection != d and pinDirection != (-d[0], -d[1]):
+                        continue
+                    for endRow, endCol in line:
+                        endPiece = self.board[endRow][endCol]
+                        if endPiece != "--":
+                            if endPiece[0] != allyColor and (piece[1] != 'K' or self.kingCanMoveTo(endRow, endCol)):
+                                moves.append(Move((r, c), (endRow, endCol), self.board))
+                            break
+        return moves
+
+    """
+    The moves that capture nothing and don't promote, pseudo-legal like getPseudoLegalMoves, the other half
+    of the moves when not in check. inCheck has to be set for the castle moves.
+    """
+    def getQuietMoves(self):
+        board = self.board
+        allyColor = "w" if self.whiteToMove else "b"
+        direction = -1 if self.whiteToMove else 1
+        moves = []
+        for r in range(8):
+            for c in range(8):
+                piece = board[r][c]
+                if piece[0] != allyColor:
+                    continue
+                if piece[1] == 'p':
+                    endRow = r + direction
+                    if endRow != 0 and endRow != 7 and board[endRow][c] == "--":
+                        moves.append(Move((r, c), (endRow, c), board))
+                        if r == (6 if self.whiteToMove else 1) and board[endRow + direction][c] == "--":
+                            moves.append(Move((r, c), (endRow + direction, c), board))
+                    continue
+                for _, line in PIECE_LINES[piece[1]][r * 8 + c]:
+                    for endRow, endCol in line:
+                        if board[endRow][endCol] != "--":
+                            break
+                        if piece[1] != 'K' or self.kingCanMoveTo(endRow, endCol):
+                            moves.append(Move((r, c), (endRow, endCol), board))
+        kingRow, kingCol = self.whiteKingLocation if self.whiteToMove else self.blackKingLocation
+        self.getCastleMoves(kingRow, kingCol, moves)
+        return moves
+
+    """
+    Captures, en-passant captures and promotions of the pawn at r, c
+    """
+    def getPawnCaptures(self, r, c, pinDirection, moves):
+        direction = -1 if self.whiteToMove else 1
+        enemyColor = "b" if self.whiteToMove else "w"
+        endRow = r + direction
+        for dc in (-1, 1):
+            endCol = c + dc
+            if not 0 <= endCol < 8:
+                continue
+            if pinDirection is not None and pinDirection != (direction, dc) and pinDirection != (-direction, -dc):
+                continue
+            if self.board[endRow][endCol][0] == enemyColor:
+                moves.append(Move((r, c), (endRow, endCol), self.board))
+            elif (endRow, endCol) == self.enpassantPossible:
+                # En-passant can expose the king along the row, getPawnMoves already checks for that
+                pawnMoves = []
+                self.getPawnMoves(r, c, pawnMoves)
+                moves.extend(move for move in pawnMoves if move.isEnpassantMove)
+        if (endRow == 0 or endRow == 7) and self.board[endRow][c] == "--":
+            if pinDirection is None or pinDirection[1] == 0:
+                moves.append(Move((r, c), (endRow, c), self.board))
+
+    """
+    If the king of the side to move would be safe on r, c
+    """
+    def kingCanMoveTo(self, r, c):
+        kingRow, kingCol = self.whiteKingLocation if self.whiteToMove else self.blackKingLocation
+        king = self.board[kingRow][kingCol]
+        self.board[kingRow][kingCol] = "--" # The king can't shield the square from a slider behind it
+        safe = not self.squareUnderAttack(r, c)
+        self.board[kingRow][kingCol] = king
+        return safe
+
     """
     Returns if the player is in check, a list of pins, and a list of checks
     """
@@ -278,59 +827,51 @@ class GameState():
             startRow = self.blackKingLocation[0]
             startCol = self.blackKingLocation[1]
         # Check outward from king for pins and checks, keep track of pins
-        directions = ((-1, 0), (0, -1), (1, 0), (0, 1), (-1, -1), (-1, 1), (1, -1), (1, 1))
-        for j in range(len(directions)):
-            d = directions[j]
+        kingSq = startRow * 8 + startCol
+        for j in range(8):
+            d = DIRECTIONS[j]
             possiblePin = () # Reset possible pins
-            for i in range(1, 8):
-                endRow = startRow + d[0] * i
-                endCol = startCol + d[1] * i
-                if 0 <= endRow < 8 and 0 <= endCol < 8:
-                    endPiece = self.board[endRow][endCol]
-                    if endPiece[0] == allyColor and endPiece[1] != 'K':
-                        if possiblePin == (): # 1st allied piece could be pinned
-                            possiblePin = (endRow, endCol, d[0], d[1])
-                        else: # 2nd allied piece, so no pin or check possible in this direction
+            for i, (endRow, endCol) in enumerate(RAYS[kingSq][j], 1):
+                endPiece = self.board[endRow][endCol]
+                if endPiece[0] == allyColor and endPiece[1] != 'K':
+                    if possiblePin == (): # 1st allied piece could be pinned
+                        possiblePin = (endRow, endCol, d[0], d[1])
+                    else: # 2nd allied piece, so no pin or check possible in this direction
+                        break
+
+                elif endPiece[0] == enemyColor:
+                    type = endPiece[1]
+                    # There are 5 possiblities here in this complex conditional
+
+                    # 1) Orthoginally away from the king and piece is a rook
+                    # 2) Diagonally away from the king and the piece is a bishop
+                    # 3) 1 square diagonally away from the king and the piece is a pawn
+                    # 4) Any direction and the piece is a queen
+                    # 5) Any direction 1 sqaure away from the king and the piece is a king(This is
+                    # to prevent a king move to a square controlled by another king)
+                    if (0 <= j <= 3 and type == 'R') or \
+                            (4 <= j <= 7 and type == 'B') or \
+                            (i == 1 and type == 'p' and ((enemyColor == 'w' and 6 <= j <= 7) or \
+                                (enemyColor == 'b' and 4 <= j <= 5))) or \
+                            (type == 'Q') or (i == 1 and type == 'K'):
+
+                        if possiblePin == (): # No Piece blocking, so check
+                            inCheck = True
+                            checks.append((endRow, endCol, d[0], d[1]))
                             break
-
-                    elif endPiece[0] == enemyColor:
-                        type = endPiece[1]
-                        # There are 5 possiblities here in this complex conditional
-
-                        # 1) Orthoginally away from the king and piece is a rook
-                        # 2) Diagonally away from the king and the piece is a bishop
-                        # 3) 1 square diagonally away from the king and the piece is a pawn
-                        # 4) Any direction and the piece is a queen
-                        # 5) Any direction 1 sqaure away from the king and the piece is a king(This is
-                        # to prevent a king move to a square controlled by another king)
-                        if (0 <= j <= 3 and type == 'R') or \
-                                (4 <= j <= 7 and type == 'B') or \
-                                (i == 1 and type == 'p' and ((enemyColor == 'w' and 6 <= j <= 7) or \
-                                    (enemyColor == 'b' and 4 <= j <= 5))) or \
-                                (type == 'Q') or (i == 1 and type == 'K'):
-
-                            if possiblePin == (): # No Piece blocking, so check
-                                inCheck = True
-                                checks.append((endRow, endCol, d[0], d[1]))
-                                break
-                            else: # Piece blocking so pin
-                                pins.append(possiblePin)
-                                break
-
-                        else: # Enemy piece not applying check
+                        else: # Piece blocking so pin
+                            pins.append(possiblePin)
                             break
-                
-
-        # Check for knight checks 
-        knightMoves = ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1))
-        for k in knightMoves:
-            endRow = startRow + k[0]
-            endCol = startCol + k[1]
-            if 0 <= endRow < 8 and 0 <= endCol < 8:
-                piece = self.board[endRow][endCol]  
-                if (piece[0] == enemyColor and piece[1] == 'N'):
-                    inCheck = True
-                    checks.append((endRow, endCol, k[0], k[1]))
+
+                    else: # Enemy piece not applying check
+                        break
+
+        # Check for knight checks
+        enemyKnight = enemyColor + "N"
+        for endRow, endCol in KNIGHT_SQUARES[kingSq]:
+            if self.board[endRow][endCol] == enemyKnight:
+                inCheck = True
+                checks.append((endRow, endCol, endRow - startRow, endCol - startCol))
         return inCheck, pins, checks
             
 
@@ -352,13 +893,13 @@ class GameState():
         # Generate the white's two square movement
         if self.whiteToMove and r == 6:
             if self.board[r - 2][c] == "--" and self.board[r - 1][c] == "--":
-                if not piecePinned or pinDirection == (-1, 0):
+                if not piecePinned or pinDirection[1] == 0: # Pinned along the column it can still move along it
                     moves.append(Move((r, c), (r - 2, c), self.board))
 
         # Generate the blacks's two square movement
         if not self.whiteToMove and r == 1:
             if self.board[r + 2][c] == "--" and self.board[r + 1][c] == "--":
-                if not piecePinned or pinDirection == (1, 0):
+                if not piecePinned or pinDirection[1] == 0:
                     moves.append(Move((r, c), (r + 2, c), self.board))  
 
         # Get the movement and king info based on the current turn
@@ -369,7 +910,7 @@ class GameState():
                  
         # Generate the one square movement based on the turn
         if self.board[r + 1 * direction][c] == "--": 
-            if not piecePinned or pinDirection == (1 * direction, 0):
+            if not piecePinned or pinDirection[1] == 0:
                 moves.append(Move((r, c), (r + 1 * direction, c), self.board))
 
         # Get the enemy color
@@ -401,8 +942,10 @@ class GameState():
                                 if square[0] == enemyColor and (square[1] == 'R' or square[1] == 'Q'):
                                     if not blockingPiece:
                                         attackingPiece = True
-                                elif square != "--":
+                                    break
+                                elif square != "--": # Only the first piece past the pawns matters
                                     blockingPiece = True
+                                    break
                         if not attackingPiece or blockingPiece:
                             moves.append(Move((r, c), (r + 1 * direction, c + 1), self.board, isEnpassantMove = True))
 
@@ -430,8 +973,10 @@ class GameState():
                                 if square[0] == enemyColor and (square[1] == 'R' or square[1] == 'Q'):
                                     if not blockingPiece:
                                         attackingPiece = True
-                                elif square != "--":
+                                    break
+                                elif square != "--": # Only the first piece past the pawns matters
                                     blockingPiece = True
+                                    break
                         if not attackingPiece or blockingPiece:
                             moves.append(Move((r, c), (r + 1 * direction, c - 1), self.board, isEnpassantMove = True))                        
 
@@ -451,49 +996,27 @@ class GameState():
                     self.pins.remove(self.pins[i])
                 break
 
-        directions = [(1, 0), (-1, 0), (0, 1), (0, -1)]
         color = self.board[r][c][0]
 
-        for d in directions:
-            for i in range(1, 8):
-                endRow = r + i * d[0]
-                endCol = c + i * d[1]
-                if not piecePinned or pinDirection == d or pinDirection == (-d[0], -d[1]):
-                    if 0 <= endRow<= 7 and 0 <= endCol <= 7:
-                        if self.board[endRow][endCol] == "--":
+        for d, line in PIECE_LINES['R'][r * 8 + c]:
+            if not piecePinned or pinDirection == d or pinDirection == (-d[0], -d[1]):
+                for endRow, endCol in line:
+                    if self.board[endRow][endCol] == "--":
+                        moves.append(Move((r, c), (endRow, endCol), self.board))
+                    else:
+                        if self.board[endRow][endCol][0] != color:
                             moves.append(Move((r, c), (endRow, endCol), self.board))
-                        else:
-                            if self.board[endRow][endCol][0] is not color:
-                                moves.append(Move((r, c), (endRow, endCol), self.board))
-                            break
+                        break
 
     """
     Get all the possible moves for the king located at r, c
     """
     def getKingMoves(self, r, c, moves):
-        rowMoves = (-1, -1, -1, 0, 0, 1, 1, 1)
-        colMoves = (-1, 0, 1, -1, 1, -1, 0, 1)
         allyColor = "w" if self.whiteToMove else "b"
-        for i in range(8):
-            endRow = r + rowMoves[i]
-            endCol = c + colMoves[i]
-            if 0 <= endRow < 8 and 0 <= endCol < 8:
-                endPiece = self.board[endRow][endCol]
-                if endPiece[0] != allyColor: # Not an ally piece (empty or enemy piece)
-                    # place king on end square and check for checks
-                    if allyColor == 'w':
-                        self.whiteKingLocation = (endRow, endCol)
-                    else:
-                        self.blackKingLocation = (endRow, endCol)
-                    inCheck, _, _ = self.checkForPinsAndChecks()
-                    if not inCheck:
-                        moves.append(Move((r, c), (endRow, endCol), self.board))
-                    # Place king back on original location
-                    if allyColor == 'w':
-                        self.whiteKingLocation = (r, c)
-                    else:
-                        self.blackKingLocation = (r, c)
-    
+        for endRow, endCol in KING_SQUARES[r * 8 + c]:
+            endPiece = self.board[endRow][endCol]
+            if endPiece[0] != allyColor and self.kingCanMoveTo(endRow, endCol): # Empty or enemy and not attacked
+                moves.append(Move((r, c), (endRow, endCol), self.board))
 
     """
     Get all the possible moves for the queen located at r, c
@@ -519,20 +1042,16 @@ class GameState():
                 break
 
         color = self.board[r][c][0]
-        directions = [(1, 1), (1, -1), (-1, 1), (-1, -1)]
-
-        for d in directions:
-            for i in range(1, 8):
-                endRow = r + i * d[0]
-                endCol = c + i * d[1]
-                if not piecePinned or pinDirection == d or pinDirection == (-d[0], -d[1]):
-                    if 0 <= endRow <= 7 and 0 <= endCol <= 7:
-                        if self.board[endRow][endCol] == "--":
+
+        for d, line in PIECE_LINES['B'][r * 8 + c]:
+            if not piecePinned or pinDirection == d or pinDirection == (-d[0], -d[1]):
+                for endRow, endCol in line:
+                    if self.board[endRow][endCol] == "--":
+                        moves.append(Move((r, c), (endRow, endCol), self.board))
+                    else:
+                        if self.board[endRow][endCol][0] != color:
                             moves.append(Move((r, c), (endRow, endCol), self.board))
-                        else:
-                            if self.board[endRow][endCol][0] is not color:
-                                moves.append(Move((r, c), (endRow, endCol), self.board))
-                            break
+                        break
 
     """
     Get all the possible moves for the knight located at r, c
@@ -545,17 +1064,14 @@ class GameState():
                 self.pins.remove(self.pins[i])
                 break
 
-        knightMoves = ((-2, 1), (2, -1), (-2, -1), (2, 1), (1, 2), (-1, -2), (-1, 2), (1, -2))
+        if piecePinned:
+            return moves
         allyColor = "w" if self.whiteToMove else "b"
-        for m in knightMoves:
-            endRow = r + m[0]
-            endCol = c + m[1]
-            if 0 <= endRow < 8 and 0 <= endCol < 8:
-                if not piecePinned:
-                    endPiece = self.board[endRow][endCol]
-                    if endPiece[0] != allyColor:
-                        moves.append(Move((r, c), (endRow, endCol), self.board))
-                    
+        for endRow, endCol in KNIGHT_SQUARES[r * 8 + c]:
+            endPiece = self.board[endRow][endCol]
+            if endPiece[0] != allyColor:
+                moves.append(Move((r, c), (endRow, endCol), self.board))
+
         return moves
 
     """
@@ -564,10 +1080,10 @@ class GameState():
     def getCastleMoves(self, r, c, moves):
         if self.inCheck:
             return # Can't castle while we are in check
-        if (self.whiteToMove and self.currentCastlingRight.wks) or (not self.whiteToMove and self.currentCastlingRight.bks):
+        if self.castlingRights & (WHITE_KINGSIDE if self.whiteToMove else BLACK_KINGSIDE):
             self.getKingSideCastleMoves(r, c, moves)
 
-        if (self.whiteToMove and self.currentCastlingRight.wqs) or (not self.whiteToMove and self.currentCastlingRight.bqs):
+        if self.castlingRights & (WHITE_QUEENSIDE if self.whiteToMove else BLACK_QUEENSIDE):
             self.getQueenSideCastleMoves(r, c, moves)
 
             
@@ -581,15 +1097,16 @@ class GameState():
             if not self.squareUnderAttack(r, c - 1) and not self.squareUnderAttack(r, c - 2):
                 moves.append(Move((r, c), (r, c - 2), self.board, isCastleMove = True))
 
-class CastleRights():
-    def __init__(self, wks, bks, wqs, bqs):
-        self.wks = wks
-        self.bks = bks
-        self.wqs = wqs
-        self.bqs = bqs
-
-
 class Move():
+    # Fixed attributes instead of a __dict__ per move, the generators create a lot of them
+    __slots__ = ("startRow", "startCol", "endRow", "endCol", "pieceMoved", "pieceCaptured", "isEnpassantMove",
+                 "isPawnPromotion", "isCastleMove", "isCapture", "moveID")
+
+    # A move packs into an int: the start square in bits 0-5, the end square in bits 6-11 (square = row * 8 + col)
+    # and the flags below. moveID is the squares part, which is enough to tell the moves of a position apart.
+    ENPASSANT_FLAG = 1 << 12
+    CASTLE_FLAG = 1 << 13
+    PROMOTION_FLAG = 1 << 14 # Always to a queen
 
     # maps keys to values
     # key : value
@@ -605,20 +1122,22 @@ class Move():
 
 
     def __init__(self, startSq, endSq, board, isEnpassantMove = False, isCastleMove = False):
-        self.startRow = startSq[0]
-        self.startCol = startSq[1]
-        self.endRow = endSq[0]
-        self.endCol = endSq[1]
-        self.pieceMoved = board[self.startRow][self.startCol]
-        self.pieceCaptured = board[self.endRow][self.endCol]
+        self.startRow = startRow = startSq[0]
+        self.startCol = startCol = startSq[1]
+        self.endRow = endRow = endSq[0]
+        self.endCol = endCol = endSq[1]
+        self.pieceMoved = pieceMoved = board[startRow][startCol]
+        self.moveID = startRow * 8 + startCol | (endRow * 8 + endCol) << 6
 
         # En-passant
         self.isEnpassantMove = isEnpassantMove
-        if self.isEnpassantMove:
-           self.pieceCaptured = board[self.startRow][self.endCol]
+        if isEnpassantMove:
+            self.pieceCaptured = board[startRow][endCol]
+        else:
+            self.pieceCaptured = board[endRow][endCol]
 
         # Pawn Promotion
-        self.isPawnPromotion = ((self.pieceMoved == 'wp' and self.endRow == 0) or (self.pieceMoved == 'bp' and self.endRow == 7))
+        self.isPawnPromotion = (pieceMoved == 'wp' and endRow == 0) or (pieceMoved == 'bp' and endRow == 7)
 
         # Castle move
         self.isCastleMove = isCastleMove
@@ -627,18 +1146,36 @@ class Move():
         self.isCapture = self.pieceCaptured != "--"
 
     """
-    Overring the equals method
+    Build the Move for a packed move in the position on board
+    """
+    @classmethod
+    def fromCode(cls, code, board):
+        return cls(divmod(code & 63, 8), divmod(code >> 6 & 63, 8), board,
+                   isEnpassantMove = code & cls.ENPASSANT_FLAG != 0, isCastleMove = code & cls.CASTLE_FLAG != 0)
+
+    """
+    The move packed into an int with its flags, Move.fromCode turns it back into a Move
+    """
+    def encode(self):
+        return self.moveID | (self.ENPASSANT_FLAG if self.isEnpassantMove else 0) | \
+            (self.CASTLE_FLAG if self.isCastleMove else 0) | (self.PROMOTION_FLAG if self.isPawnPromotion else 0)
+
+    """
+    Overring the equals method, two moves are equal when they go between the same squares
     """
     def __eq__(self, other):
         if isinstance(other, Move):
-            return self.getChessNotation() == other.getChessNotation()
+            return self.moveID == other.moveID
         return False
+
+    def __hash__(self):
+        return self.moveID
         
     def getChessNotation(self):
         return self.getRankFile(self.startRow, self.startCol) + self.getRankFile(self.endRow, self.endCol)
 
     def getRankFile(self, r, c):
-        return self.colsToFiles[r] + self.rowsToRanks[c]
+        return self.colsToFiles[c] + self.rowsToRanks[r]
 
     # Overriding to the String function
     def __str__(self):
@@ -665,4 +1202,41 @@ class Move():
         if self.pieceMoved[1]:
             if self.isCapture:
                 moveString += "x"
-            return moveString + endSquare
\ No newline at end of file
+            return moveString + endSquare
+
+"""
+The move in standard algebraic notation, as PGN files want it. gs is the position before the move and
+validMoves its legal moves.
+"""
+def toSan(gs, move, validMoves):
+    if move.isCastleMove:
+        san = "O-O" if move.endCol == 6 else "O-O-O"
+    else:
+        piece = move.pieceMoved[1]
+        target = move.getRankFile(move.endRow, move.endCol)
+        capture = move.pieceCaptured != "--" or move.isEnpassantMove
+        if piece == "p":
+            san = (move.getRankFile(move.startRow, move.startCol)[0] + "x" if capture else "") + target
+            if move.isPawnPromotion:
+                san += "=Q"
+        else:
+            # Another piece of the same kind that can reach the square needs the file or rank of the start square
+            others = [other for other in validMoves if other.pieceMoved == move.pieceMoved and other != move and
+                      (other.endRow, other.endCol) == (move.endRow, move.endCol)]
+            start = move.getRankFile(move.startRow, move.startCol)
+            disambiguation = ""
+            if others:
+                if all(other.startCol != move.startCol for other in others):
+                    disambiguation = start[0]
+                elif all(other.startRow != move.startRow for other in others):
+                    disambiguation = start[1]
+                else:
+                    disambiguation = start
+            san = piece + disambiguation + ("x" if capture else "") + target
+    gs.makeMove(move)
+    if len(gs.getValidMoves()) == 0 and gs.inCheck:
+        san += "#"
+    elif gs.inCheck:
+        san += "+"
+    gs.undoMove()
+    return san
@@ -3,11 +3,13 @@ This is our main driver file. It will be responsible for handling user input and
 """
 
 import pygame as p
+from multiprocessing import Process, Queue
 from ChessEngine import GameState, Move
-from ChessAI import randomAlgorithm, alphaBetaNegaMaxAlgorithm
+from ChessBitboard import BitboardGameState
+from ChessAI import randomAlgorithm, Searcher
+from ChessBook import getBookMove
 import button
 
-p.init()
 BOARD_WIDTH = BOARD_HEIGHT = 512 # 400 is another good option.
 MOVE_LOG_PANEL_WIDTH = 250
 MOVE_LOG_PANEL_HEIGHT = BOARD_HEIGHT
@@ -17,8 +19,11 @@ MAX_FPS = 15 # For animations
 IMAGES = {}
 PLAYER_ONE = True # If a Human is playing white, than this will be True. If an Ai then False
 PLAYER_TWO = True # Same as above but for black
-AI = alphaBetaNegaMaxAlgorithm # If an Ai is playing
+AI = Searcher.iterativeDeepeningAlgorithm # If an Ai is playing
 DEPTH = 1 # How many moves ahead the AI is looking
+MOVE_TIME = 3000 # Milliseconds the AI may think per move, it stops deepening when they run out
+USE_BITBOARDS = True # Generate the moves with the bitboard backend, it finds the same moves as GameState but faster
+BOOK_FILE = "book.bin" # Opening book built with ChessBook.py, the AI plays its moves without searching while it has one
 
 
 """
@@ -136,7 +141,7 @@ def main():
     screen = p.display.set_mode((BOARD_WIDTH + MOVE_LOG_PANEL_WIDTH, BOARD_HEIGHT))
     clock = p.time.Clock()
     closed = getHumanOrAI(screen)
-    gs = GameState()
+    gs = BitboardGameState() if USE_BITBOARDS else GameState()
     moveLogFont = p.font.SysFont("Helvitca", 16, False, False)
     validMoves = gs.getValidMoves()
     moveMade = False # Flag variable for when a move is made
@@ -147,8 +152,8 @@ def main():
     sqSelected = () # No sqaure is selected, keep track of the last click of the user (tuple: (row, col))
     playerClicks = [] # Keeps track of player clicks (two tuples [(6, 4), (4, 4)])
     gameOver = False
-    AIthinking = False
-    moveFinderProcess = None
+    AIthinking = False # The AI is searching in moveFinderProcess, it puts the move it found in returnQueue
+    moveFinderProcess, requestQueue, returnQueue = startAIProcess()
     while (running and closed == False):
         humanTurn = (gs.whiteToMove and PLAYER_ONE) or (not gs.whiteToMove and PLAYER_TWO)
         for e in p.event.get():
@@ -180,6 +185,11 @@ def main():
                             playerClicks = [sqSelected]
 
             elif e.type == p.KEYDOWN:
+                if (e.key == p.K_z or e.key == p.K_SPACE) and AIthinking: # Cancel the search of the position that's going away
+                    moveFinderProcess.terminate()
+                    moveFinderProcess, requestQueue, returnQueue = startAIProcess()
+                    AIthinking = False
+
                 if e.key == p.K_z: # Undo when 'Z' is pressed
                     gs.undoMove()
                     moveMade = True
@@ -187,7 +197,8 @@ def main():
                     gameOver = False
 
                 if e.key == p.K_SPACE: # Reset the board when r is pressed                    
-                    gs = GameState()
+                    gs = BitboardGameState() if USE_BITBOARDS else GameState()
+                    requestQueue.put(None) # New game, the AI forgets what it learned
                     validMoves = gs.getValidMoves()
                     sqSelected = ()
                     playerClicks = []
@@ -195,23 +206,21 @@ def main():
                     animate = False
                     gameOver = False
 
-        # AI move finder
+        # AI move finder, it runs in its own process so the window keeps responding while it thinks
         if not gameOver and not humanTurn:
-            if not gs.whiteToMove:
-                AImove = AI(gs, validMoves, DEPTH)
-                if AImove is None:
-                    AImove = randomAlgorithm(validMoves)
-                gs.makeMove(AImove)
-                moveMade = True
-                animate = True
+            if not AIthinking:
+                AIthinking = True
+                requestQueue.put((gs, validMoves, DEPTH, MOVE_TIME))
 
-            elif gs.whiteToMove:
-                AImove = AI(gs, validMoves, DEPTH)
+            elif not returnQueue.empty():
+                AImoveID = returnQueue.get()
+                AImove = next((move for move in validMoves if move.moveID == AImoveID), None)
                 if AImove is None:
                     AImove = randomAlgorithm(validMoves)
                 gs.makeMove(AImove)
                 moveMade = True
                 animate = True
+                AIthinking = False
 
 
         if moveMade:
@@ -225,11 +234,51 @@ def main():
             gameOver = True
             text = "Draw by stalemate" if gs.stalemate else "Black wins by checkmate" if gs.whiteToMove else "White wins by checkmate"
             drawEndGameText(screen, text)
+        elif gs.halfmoveClock >= 100 or gs.repetitionCount() >= 2:
+            gameOver = True
+            drawEndGameText(screen, "Draw by fifty-move rule" if gs.halfmoveClock >= 100 else "Draw by threefold repetition")
 
         clock.tick(MAX_FPS)
         p.display.flip()
         drawGameState(screen, gs, validMoves, sqSelected, moveLogFont, showMove)
 
+    moveFinderProcess.terminate() # Don't leave the AI running after the window is closed
+
+"""
+Start the AI process, it keeps one Searcher for the whole game so every search starts from what the last one
+learned. Returns the process, the queue the positions are sent on and the queue the moves come back on.
+"""
+def startAIProcess():
+    requestQueue = Queue()
+    returnQueue = Queue()
+    moveFinderProcess = Process(target = runAI, args = (requestQueue, returnQueue), daemon = True)
+    moveFinderProcess.start()
+    return moveFinderProcess, requestQueue, returnQueue
+
+"""
+Runs in the AI process: waits for positions and sends back the moveID of the move found for each. The depth and
+move time come with every position, the process may have been started without the settings chosen in this one.
+None instead of a position starts a new game.
+"""
+def runAI(requestQueue, returnQueue):
+    searcher = Searcher()
+    while True:
+        request = requestQueue.get()
+        if request is None:
+            searcher.clear()
+            continue
+        gs, validMoves, depth, moveTime = request
+        returnQueue.put(findAIMove(gs, validMoves, searcher, depth, moveTime))
+
+"""
+Looks the position up in the opening book, otherwise searches it, and returns the moveID of the move it found
+"""
+def findAIMove(gs, validMoves, searcher, depth, moveTime):
+    AImove = getBookMove(gs, validMoves, BOOK_FILE) if BOOK_FILE else None
+    if AImove is None:
+        AImove = AI(searcher, gs, validMoves, depth, moveTime = moveTime)
+    return None if AImove is None else AImove.moveID
+
 """
 Responsible for all the graphics within a current GameState
 """
@@ -365,4 +414,5 @@ def drawEndGameText(screen, text):
     screen.blit(textObject, textLocation.move(2, 2))
 
 if __name__ == "__main__":
+    p.init()
     main()
@@ -0,0 +1,246 @@
+"""
+Headless engine against engine matches, to check that a change to the search doesn't cost playing strength.
+Two players are configured as algorithm[:depth] or algorithm:<ms>ms, for example alphabeta:3, negamax:2 or
+alphabeta:200ms (iterative deepening with a time limit per move). The algorithms are random, greedy, lessgreedy,
+minmax, negamax and alphabeta. Games are played in pairs from the same randomised opening with the colours
+swapped, spread over a pool of worker processes. Games that drag on are adjudicated, every game is written
+to a PGN file and the result is reported as wins/draws/losses for the first player with an Elo difference
+and its 95% error bar, plus the average nodes per second of each player.
+Run it with: python ChessMatch.py alphabeta:3 alphabeta:2 [--games N] [--processes N] [--pgn match.pgn]
+"""
+
+import argparse
+import math
+import multiprocessing
+import os
+import random
+import sys
+import time
+import ChessAI
+from ChessEngine import toSan
+from ChessBitboard import BitboardGameState
+
+ALGORITHMS = ["random", "greedy", "lessgreedy", "minmax", "negamax", "alphabeta"]
+DEFAULT_DEPTH = 3
+OPENING_PLIES = 4 # Random moves played by both sides before the engines take over
+MAX_PLIES = 200 # A game still going after this many plies is adjudicated a draw
+ADJUDICATE_MATERIAL = 12 # Material lead in pawns that wins the game ...
+ADJUDICATE_PLIES = 8 # ... once it has lasted this many plies in a row
+
+"""
+Turn a player description like alphabeta:3 or alphabeta:200ms into (algorithm, depth, move time in ms)
+"""
+def parsePlayer(text):
+    name, _, limit = text.lower().partition(":")
+    if name not in ALGORITHMS:
+        raise ValueError("unknown algorithm %s, use one of %s" % (name, ", ".join(ALGORITHMS)))
+    if limit.endswith("ms") and limit[:-2].isdigit():
+        if name != "alphabeta":
+            raise ValueError("only alphabeta can play with a time limit")
+        return name, None, int(limit[:-2])
+    if limit and not limit.isdigit():
+        raise ValueError("bad depth or time limit %s" % limit)
+    return name, int(limit) if limit else DEFAULT_DEPTH, None
+
+"""
+Pick a move for player in gs, alphabeta searching with the player's searcher. The search runs on a copy of the
+game, replayed move by move so it sees the repetitions, because some of the simple algorithms leave moves made
+on the board they are given. Returns (move, nodes, seconds).
+"""
+def playerMove(player, gs, searcher):
+    name, depth, moveTime = player
+    searchState = BitboardGameState()
+    for move in gs.moveLog:
+        searchState.makeMove(move)
+    validMoves = searchState.getValidMoves()
+    ChessAI.counter = 0
+    ChessAI.DEPTH = depth # minMaxAlgorithm and negaMaxAlgorithm read the depth from the module
+    startTime = time.perf_counter()
+    if name == "random":
+        move = ChessAI.randomAlgorithm(validMoves)
+    elif name == "greedy":
+        move = ChessAI.greedyAlgorithm(searchState, validMoves)
+    elif name == "lessgreedy":
+        move = ChessAI.lessGreedyAlgorithm(searchState, validMoves)
+    elif name == "minmax":
+        move = ChessAI.minMaxAlgorithm(searchState, validMoves)
+    elif name == "negamax":
+        move = ChessAI.negaMaxAlgorithm(searchState, validMoves)
+    elif moveTime is not None:
+        move = searcher.iterativeDeepeningAlgorithm(searchState, validMoves, moveTime = moveTime)
+    else:
+        move = searcher.alphaBetaNegaMaxAlgorithm(searchState, validMoves, depth)
+    seconds = time.perf_counter() - startTime
+    # Play the move on the real game, the search found it in the copy
+    gameMoves = gs.getValidMoves()
+    move = next((gameMove for gameMove in gameMoves if move is not None and gameMove == move), None)
+    if move is None:
+        move = random.choice(gameMoves) # lessGreedyAlgorithm can come back without a move
+    return move, searcher.counter if name == "alphabeta" else ChessAI.counter, seconds
+
+"""
+Play one game, returns the game record as a dict. opening is a list of random numbers that choose the
+opening moves, so both games of a pair start from the same position.
+"""
+def playGame(task):
+    gameNumber, white, black, whiteName, blackName, opening = task
+    gs = BitboardGameState()
+    players = {True : white, False : black}
+    searchers = {True : ChessAI.Searcher(), False : ChessAI.Searcher()} # Each player keeps its tables for the whole game
+    sanMoves = []
+    nodes = {True : 0, False : 0}
+    seconds = {True : 0.0, False : 0.0}
+    result = termination = None
+    leadPlies = 0
+    while result is None:
+        validMoves = gs.getValidMoves()
+        if len(validMoves) == 0:
+            if gs.inCheck:
+                result, termination = ("0-1" if gs.whiteToMove else "1-0"), "checkmate"
+            else:
+                result, termination = "1/2-1/2", "stalemate"
+            break
+        if gs.halfmoveClock >= 100:
+            result, termination = "1/2-1/2", "fifty-move rule"
+            break
+        if gs.repetitionCount() >= 2:
+            result, termination = "1/2-1/2", "threefold repetition"
+            break
+        if len(gs.moveLog) >= MAX_PLIES:
+            result, termination = "1/2-1/2", "adjudication: move limit"
+            break
+        if all(piece[1] == "K" for row in gs.board for piece in row if piece != "--"):
+            result, termination = "1/2-1/2", "insufficient material"
+            break
+        ply = len(gs.moveLog)
+        if ply < len(opening):
+            move = validMoves[int(opening[ply] * len(validMoves))]
+        else:
+            side = gs.whiteToMove
+            move, moveNodes, moveSeconds = playerMove(players[side], gs, searchers[side])
+            nodes[side] += moveNodes
+            seconds[side] += moveSeconds
+        sanMoves.append(toSan(gs, move, validMoves))
+        gs.makeMove(move)
+        # A big material lead that lasts is as good as a win
+        material = ChessAI.scoreMaterial(gs.board)
+        leadPlies = leadPlies + 1 if abs(material) >= ADJUDICATE_MATERIAL else 0
+        if leadPlies >= ADJUDICATE_PLIES:
+            result, termination = ("1-0" if material > 0 else "0-1"), "adjudication: material"
+    return {"game" : gameNumber, "white" : whiteName, "black" : blackName, "result" : result,
+            "termination" : termination, "moves" : sanMoves, "nodes" : (nodes[True], nodes[False]),
+            "seconds" : (seconds[True], seconds[False])}
+
+def formatPgn(game, date):
+    tags = [("Event", "Engine match"), ("Site", "ChessMatch.py"), ("Date", date), ("Round", str(game["game"])),
+            ("White", game["white"]), ("Black", game["black"]), ("Result", game["result"]),
+            ("Termination", game["termination"]), ("PlyCount", str(len(game["moves"])))]
+    tokens = [("%d. " % (i // 2 + 1) if i % 2 == 0 else "") + san for i, san in enumerate(game["moves"])]
+    # Movetext lines are kept under 80 characters
+    lines = [""]
+    for token in tokens + [game["result"]]:
+        if lines[-1] and len(lines[-1]) + len(token) >= 79:
+            lines.append("")
+        lines[-1] = lines[-1] + " " + token if lines[-1] else token
+    return "\n".join('[%s "%s"]' % tag for tag in tags) + "\n\n" + "\n".join(lines) + "\n\n"
+
+"""
+Elo difference for a score fraction, infinite for a clean sweep
+"""
+def eloDifference(score):
+    if score <= 0:
+        return -math.inf
+    if score >= 1:
+        return math.inf
+    return -400 * math.log10(1 / score - 1)
+
+"""
+The Elo difference of the first player and the half width of its 95% confidence interval, from the
+wins, draws and losses of the first player
+"""
+def eloWithError(wins, draws, losses):
+    games = wins + draws + losses
+    score = (wins + draws / 2) / games
+    variance = (wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2 + losses * score ** 2) / games
+    margin = 1.96 * math.sqrt(variance / games)
+    if score - margin <= 0 or score + margin >= 1:
+        return eloDifference(score), math.inf # Too few games, or one sided, to put a bound on it
+    error = (eloDifference(score + margin) - eloDifference(score - margin)) / 2
+    return eloDifference(score), error
+
+"""
+Play games games between the player descriptions first and second, returns the list of game records
+"""
+def runMatch(first, second, games = 10, processes = None, pgnPath = None, seed = None, openingPlies = OPENING_PLIES):
+    players = {first : parsePlayer(first), second : parsePlayer(second)}
+    rng = random.Random(seed)
+    tasks = []
+    for gameNumber in range(1, games + 1):
+        if gameNumber % 2 == 1:
+            opening = [rng.random() for _ in range(openingPlies)]
+        white, black = (first, second) if gameNumber % 2 == 1 else (second, first)
+        tasks.append((gameNumber, players[white], players[black], white, black, opening))
+    date = time.strftime("%Y.%m.%d")
+    pgnFile = open(pgnPath, "w") if pgnPath else None
+    records = []
+    with multiprocessing.Pool(processes or os.cpu_count() or 1) as pool:
+        for game in pool.imap_unordered(playGame, tasks):
+            records.append(game)
+            if pgnFile:
+                pgnFile.write(formatPgn(game, date))
+                pgnFile.flush()
+            sys.stderr.write("game %d: %s - %s %s (%s)\n" % (game["game"], game["white"], game["black"],
+                                                           game["result"], game["termination"]))
+    if pgnFile:
+        pgnFile.close()
+    return records
+
+"""
+Wins, draws and losses of player, and its total nodes and search seconds
+"""
+def summarise(records, player):
+    wins = draws = losses = nodes = 0
+    seconds = 0.0
+    for game in records:
+        side = 0 if game["white"] == player else 1
+        nodes += game["nodes"][side]
+        seconds += game["seconds"][side]
+        if game["result"] == "1/2-1/2":
+            draws += 1
+        elif (game["result"] == "1-0") == (side == 0):
+            wins += 1
+        else:
+            losses += 1
+    return wins, draws, losses, nodes, seconds
+
+def main():
+    parser = argparse.ArgumentParser(description = "Play a match between two engine configurations")
+    parser.add_argument("first", help = "first player, algorithm[:depth] or alphabeta:<ms>ms")
+    parser.add_argument("second", help = "second player, same format")
+    parser.add_argument("--games", type = int, default = 10, help = "games to play, in pairs with swapped colours (default 10)")
+    parser.add_argument("--processes", type = int, help = "worker processes, all the cores by default")
+    parser.add_argument("--pgn", help = "write the games to this PGN file")
+    parser.add_argument("--seed", type = int, help = "seed of the random openings")
+    parser.add_argument("--opening-plies", type = int, default = OPENING_PLIES, help = "random plies at the start of each game pair")
+    args = parser.parse_args()
+    try:
+        parsePlayer(args.first)
+        parsePlayer(args.second)
+    except ValueError as error:
+        parser.error(str(error))
+    if args.first == args.second:
+        parser.error("the players need different descriptions")
+    records = runMatch(args.first, args.second, args.games, args.processes, args.pgn, args.seed, args.opening_plies)
+    wins, draws, losses, _, _ = summarise(records, args.first)
+    elo, error = eloWithError(wins, draws, losses)
+    print("%s vs %s: +%d =%d -%d, score %.1f%%, Elo %+.0f +/- %.0f" % (args.first, args.second, wins, draws, losses,
+        100 * (wins + draws / 2) / len(records), elo, error))
+    for player in (args.first, args.second):
+        _, _, _, nodes, seconds = summarise(records, player)
+        if nodes == 0:
+            print("%s: %.2fs, the algorithm doesn't count its nodes" % (player, seconds))
+            continue
+        print("%s: %d nodes in %.2fs, %d nodes per second" % (player, nodes, seconds, nodes / max(seconds, 1e-9)))
+
+if __name__ == "__main__":
+    main()
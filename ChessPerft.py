@@ -0,0 +1,165 @@
+"""
+Perft driver and correctness suite for ChessEngine. perft counts the leaf nodes of the legal move tree to a
+given depth, so any mistake in move generation changes the count, and divide prints the count below every
+root move to narrow a wrong count down to a single move. It never imports pygame so it runs on a server.
+Run the suite with: python ChessPerft.py [--depth N] [--bitboard]
+Divide a position with: python ChessPerft.py --divide DEPTH [--fen FEN] [--bitboard]
+"""
+
+import argparse
+import sys
+import time
+from ChessEngine import GameState, STARTING_FEN
+from ChessBitboard import BitboardGameState
+
+"""
+Reference positions with their node counts for depth 1, 2, 3, ...
+The engine always promotes to a queen, so where promotions appear in the tree the counts are smaller than
+the published ones, which count the under-promotions too. Those positions have the published counts in a comment.
+"""
+PERFT_POSITIONS = [
+    ("Initial position", STARTING_FEN,
+        [20, 400, 8902, 197281, 4865609]),
+    ("Kiwipete", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+        [48, 2039, 97862, 4074224]), # Published: 48, 2039, 97862, 4085603
+    ("Position 3", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+        [14, 191, 2812, 43238, 674624]),
+    ("Position 4", "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+        [6, 228, 8087, 320802]), # Published: 6, 264, 9467, 422333
+    ("Position 4 mirrored", "r2q1rk1/pP1p2pp/Q4n2/bbp1p3/Np6/1B3NBn/pPPP1PPP/R3K2R b KQ - 0 1",
+        [6, 228, 8087, 320802]), # Published: 6, 264, 9467, 422333
+    ("Position 5", "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+        [41, 1373, 54007, 1806790]), # Published: 44, 1486, 62379, 2103487
+    ("Position 6", "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+        [46, 2079, 89890]),
+    # Small positions aimed at en-passant pins, castling through attacked squares and lost castling rights
+    ("En passant exposes king", "3k4/3p4/8/K1P4r/8/8/8/8 b - - 0 1",
+        [18, 92, 1670, 10138, 185429, 1132035]), # Published: ..., 185429, 1134888
+    ("En passant pinned diagonally", "8/8/4k3/8/2p5/8/B2P2K1/8 w - - 0 1",
+        [13, 102, 1266, 10276, 135655, 1013750]), # Published: ..., 135655, 1015133
+    ("En passant gives check", "8/8/1k6/2b5/2pP4/8/5K2/8 b - d3 0 1",
+        [15, 126, 1928, 13931, 206136, 1438912]), # Published: ..., 13931, 206379, 1440467
+    ("Castling through check", "5k2/8/8/8/8/8/8/4K2R w K - 0 1",
+        [15, 66, 1198, 6399, 120330, 661072]),
+    ("Queenside castling through check", "3k4/8/8/8/8/8/8/R3K3 w Q - 0 1",
+        [16, 71, 1286, 7418, 141077, 803711]),
+    ("Castling rights lost on capture", "r3k2r/1b4bq/8/8/8/8/7B/R3K2R w KQkq - 0 1",
+        [26, 1141, 27826, 1274206]),
+    ("Castling prevented", "r3k2r/8/3Q4/8/8/5q2/8/R3K2R b KQkq - 0 1",
+        [44, 1494, 50509, 1720476]),
+    ("Discovered check", "8/8/2k5/5q2/5n2/8/5K2/8 b - - 0 1",
+        [37, 183, 6559, 23527, 811573]),
+    ("Self stalemate", "K1k5/8/P7/8/8/8/8/8 w - - 0 1",
+        [2, 6, 13, 63, 331, 1924, 11175, 68182]), # Published: ..., 63, 382, 2217, 15453, 93446
+    ("Stalemate and checkmate", "8/k1P5/8/1K6/8/8/8/8 w - - 0 1",
+        [7, 19, 129, 498, 4217, 18519, 188160]), # Published: 10, 25, 268, 926, 10857, 43261, 567584
+]
+
+"""
+Positions with whether the side to move has a legal move, for hasLegalMove, which the search uses to find
+checkmates and stalemates without generating every move
+"""
+LEGAL_MOVE_POSITIONS = [
+    ("Stalemate by a pinned piece", "8/8/8/8/1n6/2k5/8/KBr5 w - - 0 1", False),
+    ("King moves beside a pinned piece", "8/8/8/8/8/2k5/8/KBr5 w - - 0 1", True),
+    ("Pinned piece moves along the pin", "8/8/8/8/8/1k6/8/K1R4r w - - 0 1", True),
+    ("Stalemate", "7k/5Q2/6K1/8/8/8/8/8 b - - 0 1", False),
+    ("Checkmate", "7k/6Q1/6K1/8/8/8/8/8 b - - 0 1", False),
+    ("Check with an escape", "6Qk/8/6K1/8/8/8/8/8 b - - 0 1", True),
+]
+
+"""
+Positions loadFen has to reject with a ValueError instead of loading something the move generator can't handle
+"""
+INVALID_FENS = [
+    ("En passant square off the board", "k7/8/8/8/8/8/8/K7 w - e9 0 1"),
+    ("En passant square without a rank", "k7/8/8/8/8/8/8/K7 w - e 0 1"),
+    ("En passant on the wrong rank", "k7/8/8/8/8/8/8/K7 w - e3 0 1"),
+    ("En passant without a pawn", "4k3/8/8/3P4/8/8/8/4K3 w - e6 0 1"),
+    ("En passant with an own pawn", "4k3/8/8/4P3/8/8/8/4K3 w - e6 0 1"),
+    ("En passant square occupied", "4k3/8/4n3/3Pp3/8/8/8/4K3 w - e6 0 1"),
+    ("En passant start square occupied", "4k3/4n3/8/3Pp3/8/8/8/4K3 w - e6 0 1"),
+    ("Black en passant without a pawn", "4k3/8/8/8/4p3/8/8/4K3 b - d3 0 1"),
+    ("White pawn on the eighth rank", "P3k3/8/8/8/8/8/8/4K3 w - - 0 1"),
+    ("Black pawn on the first rank", "4k3/8/8/8/8/8/8/p3K3 w - - 0 1"),
+    ("Unknown castling letter", "k7/8/8/8/8/8/8/K7 w X - 0 1"),
+    ("Halfmove clock not a number", "k7/8/8/8/8/8/8/K7 w - - x 1"),
+]
+
+"""
+Number of leaf nodes of the legal move tree below the current position
+"""
+def perft(gs, depth):
+    if depth == 1:
+        return len(gs.getValidMoveCodes()) # Bulk counting, the last ply is only counted so no Move objects are needed
+    nodes = 0
+    for move in gs.getValidMoves():
+        gs.makeMove(move)
+        nodes += perft(gs, depth - 1)
+        gs.undoMove()
+    return nodes
+
+"""
+Perft split by root move, prints each move with its node count and returns the total
+"""
+def divide(gs, depth):
+    total = 0
+    for move in gs.getValidMoves():
+        gs.makeMove(move)
+        nodes = perft(gs, depth - 1) if depth > 1 else 1
+        gs.undoMove()
+        print(move.getChessNotation(), nodes)
+        total += nodes
+    print("Total", total)
+    return total
+
+"""
+Run every reference position up to maxDepth and report nodes, time and nodes per second, then check
+hasLegalMove and that the invalid positions are rejected. Returns False if any check fails.
+"""
+def runSuite(maxDepth, gameStateClass = GameState, out = sys.stdout):
+    passed = True
+    totalNodes = 0
+    totalTime = 0
+    out.write("%-34s %5s %10s %9s %10s %s\n" % ("Position", "Depth", "Nodes", "Time", "NPS", "Result"))
+    for name, fen, counts in PERFT_POSITIONS:
+        for depth in range(1, min(maxDepth, len(counts)) + 1):
+            gs = gameStateClass(fen)
+            startTime = time.perf_counter()
+            nodes = perft(gs, depth)
+            seconds = time.perf_counter() - startTime
+            totalNodes += nodes
+            totalTime += seconds
+            result = "OK" if nodes == counts[depth - 1] else "FAIL (expected %d)" % counts[depth - 1]
+            passed = passed and nodes == counts[depth - 1]
+            out.write("%-34s %5d %10d %8.2fs %10d %s\n" % (name, depth, nodes, seconds, nodes / max(seconds, 1e-9), result))
+    out.write("Total %d nodes in %.2fs, %d nodes per second\n" % (totalNodes, totalTime, totalNodes / max(totalTime, 1e-9)))
+    for name, fen, expected in LEGAL_MOVE_POSITIONS:
+        result = "OK" if gameStateClass(fen).hasLegalMove() == expected else "FAIL (expected %s)" % expected
+        passed = passed and result == "OK"
+        out.write("%-34s %s\n" % (name, result))
+    for name, fen in INVALID_FENS:
+        try:
+            gameStateClass(fen)
+            result = "FAIL (loaded)"
+        except ValueError:
+            result = "OK"
+        passed = passed and result == "OK"
+        out.write("%-34s %s\n" % (name, result))
+    return passed
+
+def main():
+    parser = argparse.ArgumentParser(description = "Perft suite for ChessEngine")
+    parser.add_argument("--depth", type = int, default = 3, help = "maximum depth of the suite")
+    parser.add_argument("--bitboard", action = "store_true", help = "use the bitboard move generator")
+    parser.add_argument("--divide", type = int, metavar = "DEPTH", help = "divide one position instead of running the suite")
+    parser.add_argument("--fen", default = STARTING_FEN, help = "position to divide")
+    args = parser.parse_args()
+    gameStateClass = BitboardGameState if args.bitboard else GameState
+    if args.divide:
+        divide(gameStateClass(args.fen), args.divide)
+    else:
+        sys.exit(0 if runSuite(args.depth, gameStateClass) else 1)
+
+if __name__ == "__main__":
+    main()
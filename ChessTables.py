@@ -0,0 +1,59 @@
+"""
+Lookup tables for the GameState move generator, built once when the module is imported. Squares are indexed
+as row * 8 + col like in Move, and the tables hold (row, col) pairs that are already on the board, so the
+generators never have to check the bounds. The bitboard backend keeps its own tables in ChessBitboard.
+"""
+
+# The rows and columns first, then the diagonals, checkForPinsAndChecks relies on the order
+DIRECTIONS = ((-1, 0), (0, -1), (1, 0), (0, 1), (-1, -1), (-1, 1), (1, -1), (1, 1))
+ROOK_DIRECTIONS = range(0, 4) # Indices into DIRECTIONS
+BISHOP_DIRECTIONS = range(4, 8)
+# The pieces that attack along each direction
+DIRECTION_SLIDERS = ("RQ", "RQ", "RQ", "RQ", "BQ", "BQ", "BQ", "BQ")
+KNIGHT_JUMPS = ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1))
+
+"""
+The squares from r, c outwards in the direction dr, dc, up to maxSteps of them, until the edge of the board
+"""
+def raySquares(r, c, dr, dc, maxSteps = 7):
+    squares = []
+    for i in range(1, maxSteps + 1):
+        endRow, endCol = r + dr * i, c + dc * i
+        if not (0 <= endRow < 8 and 0 <= endCol < 8):
+            break
+        squares.append((endRow, endCol))
+    return tuple(squares)
+
+# RAYS[sq][d] is the squares along DIRECTIONS[d] from sq
+RAYS = [tuple(raySquares(sq // 8, sq % 8, dr, dc) for dr, dc in DIRECTIONS) for sq in range(64)]
+KNIGHT_SQUARES = [tuple(square for dr, dc in KNIGHT_JUMPS for square in raySquares(sq // 8, sq % 8, dr, dc, 1))
+                  for sq in range(64)]
+KING_SQUARES = [tuple(square for dr, dc in DIRECTIONS for square in raySquares(sq // 8, sq % 8, dr, dc, 1))
+                for sq in range(64)]
+# The squares a pawn of each colour on sq attacks, white pawns move towards row 0. They are also the squares
+# that pawns of the other colour attack sq from.
+PAWN_ATTACKS = {'w' : [raySquares(sq // 8, sq % 8, -1, -1, 1) + raySquares(sq // 8, sq % 8, -1, 1, 1) for sq in range(64)],
+                'b' : [raySquares(sq // 8, sq % 8, 1, -1, 1) + raySquares(sq // 8, sq % 8, 1, 1, 1) for sq in range(64)]}
+
+# DIRECTION_INDEX[sq1][sq2] is the index of the direction from sq1 to sq2, -1 if they are not on a line.
+# BETWEEN[sq1][sq2] is the squares strictly between them on that line, empty if they are not on one.
+DIRECTION_INDEX = [[-1] * 64 for sq in range(64)]
+BETWEEN = [[()] * 64 for sq in range(64)]
+for sq in range(64):
+    for d in range(8):
+        ray = RAYS[sq][d]
+        for i, (endRow, endCol) in enumerate(ray):
+            DIRECTION_INDEX[sq][endRow * 8 + endCol] = d
+            BETWEEN[sq][endRow * 8 + endCol] = ray[:i]
+
+# The lines a piece of each kind moves along from sq, as (direction, squares) pairs. A knight or king line is
+# one square long, the direction of a knight jump is never one a piece can be pinned along.
+PIECE_LINES = {
+    'N' : [tuple(((dr, dc), raySquares(sq // 8, sq % 8, dr, dc, 1)) for dr, dc in KNIGHT_JUMPS) for sq in range(64)],
+    'B' : [tuple((DIRECTIONS[d], RAYS[sq][d]) for d in BISHOP_DIRECTIONS) for sq in range(64)],
+    'R' : [tuple((DIRECTIONS[d], RAYS[sq][d]) for d in ROOK_DIRECTIONS) for sq in range(64)],
+    'Q' : [tuple((DIRECTIONS[d], RAYS[sq][d]) for d in range(8)) for sq in range(64)],
+    'K' : [tuple((DIRECTIONS[d], RAYS[sq][d][:1]) for d in range(8)) for sq in range(64)],
+}
+# Leave out the lines that start off the board
+PIECE_LINES = {piece : [tuple(line for line in lines if line[1]) for lines in table] for piece, table in PIECE_LINES.items()}
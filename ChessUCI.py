@@ -0,0 +1,198 @@
+"""
+A UCI (Universal Chess Interface) front end for the engine, so it can be driven by tournament managers and
+analysis tools instead of the pygame window. It reads commands on stdin and answers on stdout. The search
+runs in its own thread so stop, isready and quit are answered while it thinks. pygame is never imported.
+Run it with: python ChessUCI.py
+"""
+
+import sys
+import threading
+import time
+import ChessAI
+from ChessEngine import STARTING_FEN
+from ChessBitboard import BitboardGameState
+
+ENGINE_NAME = "Chess-Engine"
+ENGINE_AUTHOR = "Chess-Engine authors"
+DEFAULT_HASH = 64 # Megabytes
+MAX_HASH = 1024
+MAX_THREADS = 64
+TT_ENTRY_BYTES = 150 # Rough size of one transposition table entry tuple in memory
+
+"""
+A move in the long algebraic notation UCI uses, for example e2e4 or e7e8q
+"""
+def uciMove(move):
+    return move.getChessNotation() + ("q" if move.isPawnPromotion else "")
+
+"""
+The score for the side to move as an info score field. The search scores in centipawns, a mate score is
+CHECKMATE less the plies to the mate and is reported as mate in that many moves, negative when the side to
+move is the one being mated.
+"""
+def uciScore(score):
+    if abs(score) >= ChessAI.MATE_THRESHOLD:
+        moves = (ChessAI.CHECKMATE - abs(score) + 1) // 2
+        return "mate %d" % (moves if score > 0 else -moves)
+    return "cp %d" % score
+
+class UCIEngine():
+    def __init__(self, out = sys.stdout):
+        self.out = out
+        self.gs = BitboardGameState()
+        self.threads = 1
+        self.searchThread = None
+        self.infinite = False # A go infinite search only sends its bestmove after stop
+        self.stopped = threading.Event()
+        self.searcher = None
+        self.setHash(DEFAULT_HASH)
+
+    def send(self, text):
+        self.out.write(text + "\n")
+        self.out.flush()
+
+    """
+    Start a new searcher with a transposition table of about megabytes of memory, rounded down to a power of two entries.
+    The searcher is kept for the whole game, so each search starts from what the last one learned.
+    """
+    def setHash(self, megabytes):
+        entries = max(megabytes * 1024 * 1024 // TT_ENTRY_BYTES, 1)
+        if self.searcher is not None:
+            self.searcher.closeSearchPool()
+        self.searcher = ChessAI.Searcher(1 << (entries.bit_length() - 1))
+
+    """
+    Handle one line of input, returns False when the engine should quit
+    """
+    def handleCommand(self, line):
+        tokens = line.split()
+        if not tokens:
+            return True
+        command = tokens[0]
+        if command == "uci":
+            self.send("id name " + ENGINE_NAME)
+            self.send("id author " + ENGINE_AUTHOR)
+            self.send("option name Hash type spin default %d min 1 max %d" % (DEFAULT_HASH, MAX_HASH))
+            self.send("option name Threads type spin default 1 min 1 max %d" % MAX_THREADS)
+            self.send("uciok")
+        elif command == "isready":
+            self.send("readyok")
+        elif command == "setoption":
+            self.setOption(tokens)
+        elif command == "ucinewgame":
+            self.stopSearch()
+            self.searcher.clear()
+        elif command == "position":
+            self.stopSearch()
+            self.setPosition(tokens)
+        elif command == "go":
+            self.stopSearch()
+            self.go(tokens)
+        elif command == "stop":
+            self.stopSearch()
+        elif command == "quit":
+            self.stopSearch()
+            return False
+        return True
+
+    """
+    setoption name <id> value <x>, the ids are Hash (megabytes) and Threads
+    """
+    def setOption(self, tokens):
+        if "name" not in tokens or "value" not in tokens:
+            return
+        name = " ".join(tokens[tokens.index("name") + 1:tokens.index("value")]).lower()
+        value = tokens[tokens.index("value") + 1] if tokens.index("value") + 1 < len(tokens) else ""
+        if not value.isdigit():
+            return
+        if name == "hash":
+            self.setHash(min(max(int(value), 1), MAX_HASH))
+        elif name == "threads":
+            self.threads = min(max(int(value), 1), MAX_THREADS)
+
+    """
+    position [startpos | fen <fen>] [moves <move> ...]
+    """
+    def setPosition(self, tokens):
+        movesIndex = tokens.index("moves") if "moves" in tokens else len(tokens)
+        if len(tokens) > 1 and tokens[1] == "fen":
+            fen = " ".join(tokens[2:movesIndex])
+        else:
+            fen = STARTING_FEN
+        try:
+            self.gs = BitboardGameState(fen)
+        except ValueError:
+            self.send("info string invalid fen " + fen)
+            return
+        for text in tokens[movesIndex + 1:]:
+            # Only queen promotions exist, an under-promotion is played as a queen
+            move = next((move for move in self.gs.getValidMoves() if move.getChessNotation() == text[:4]), None)
+            if move is None:
+                self.send("info string illegal move " + text)
+                break
+            self.gs.makeMove(move)
+
+    """
+    go [depth N] [movetime MS] [wtime MS] [btime MS] [winc MS] [binc MS] [movestogo N] [infinite]
+    """
+    def go(self, tokens):
+        parameters = {}
+        for i, token in enumerate(tokens[:-1]):
+            if token in ("depth", "movetime", "wtime", "btime", "winc", "binc", "movestogo") and tokens[i + 1].isdigit():
+                parameters[token] = int(tokens[i + 1])
+        self.infinite = "infinite" in tokens
+        self.stopped.clear()
+        self.searcher.stopSearch = False
+        self.searchThread = threading.Thread(target = self.search, args = (parameters,), daemon = True)
+        self.searchThread.start()
+
+    """
+    Runs in the search thread, streams an info line per completed depth and ends with the bestmove
+    """
+    def search(self, parameters):
+        gs = self.gs
+        validMoves = gs.getValidMoves()
+        if len(validMoves) == 0:
+            self.send("bestmove 0000")
+            return
+        maxDepth = parameters.get("depth", ChessAI.MAX_DEPTH)
+        clock = parameters.get("wtime" if gs.whiteToMove else "btime")
+        increment = parameters.get("winc" if gs.whiteToMove else "binc", 0)
+        if self.threads > 1 and "depth" in parameters and clock is None and "movetime" not in parameters:
+            # A fixed depth search can be split between processes, it has no time limit to respect
+            startTime = time.perf_counter()
+            bestMove = self.searcher.parallelRootSearch(gs, validMoves, maxDepth, self.threads)
+            if not self.searcher.stopSearch: # A stopped search didn't reach the depth, there is nothing to report
+                self.sendInfo(maxDepth, self.searcher.searchScore, self.searcher.counter, time.perf_counter() - startTime,
+                              [move for key, move in self.searcher.principalVariation])
+        else:
+            bestMove = self.searcher.iterativeDeepeningAlgorithm(gs, validMoves, maxDepth, moveTime = parameters.get("movetime"),
+                clock = clock, increment = increment, movesToGo = parameters.get("movestogo"), infoCallback = self.sendInfo)
+        if self.infinite:
+            self.stopped.wait() # The GUI decides when an infinite search is over
+        if bestMove is None:
+            bestMove = validMoves[0]
+        self.send("bestmove " + uciMove(bestMove))
+
+    def sendInfo(self, depth, score, nodes, seconds, pv):
+        self.send("info depth %d score %s nodes %d nps %d time %d pv %s" % (depth, uciScore(score), nodes,
+            nodes / max(seconds, 1e-9), seconds * 1000, " ".join(uciMove(move) for move in pv)))
+
+    """
+    Make a running search return now and wait for it to send its bestmove
+    """
+    def stopSearch(self):
+        if self.searchThread is not None and self.searchThread.is_alive():
+            self.searcher.stopSearch = True
+            self.stopped.set()
+            self.searchThread.join()
+        self.searchThread = None
+
+def main():
+    engine = UCIEngine(sys.stdout)
+    for line in sys.stdin:
+        if not engine.handleCommand(line):
+            break
+
+if __name__ == "__main__":
+    main()